@@ -0,0 +1,227 @@
+"""Write zip archives with members compressed in parallel"""
+import concurrent.futures
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# The zip format version 2.0, which supports deflate
+_VERSION = 20
+# The UTF-8 file name flag
+_UTF8_FLAG = 0x800
+# The bytes read at a time
+_CHUNK_SIZE = 1 << 20
+# Archives larger than it need zip64
+_ZIP64_SIZE = 0xFFFFFFFF
+
+def list_files(root: str, prefix: str = '') -> List[Tuple[str, str]]:
+    """Return the (name in the archive, file path) of non-empty files in root.
+
+    Hidden files and directories at the top level of root are skipped. The
+    names are prefixed by prefix. Symbolic links to directories are followed,
+    except for those pointing to a directory they are in.
+    """
+    members = []
+    # the real paths of a directory and its parents, to skip cyclic links
+    parents = {root: {os.path.realpath(root)}}
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        if dirpath == root:
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            filenames = [f for f in filenames if not f.startswith('.')]
+        dirnames.sort()
+        real_paths = parents.pop(dirpath)
+        for d in list(dirnames):
+            real_path = os.path.realpath(os.path.join(dirpath, d))
+            if real_path in real_paths:
+                logging.warning(f'Skip {os.path.join(dirpath, d)}, a link to '
+                                'its parent directory')
+                dirnames.remove(d)
+            else:
+                parents[os.path.join(dirpath, d)] = real_paths | {real_path}
+        for fn in sorted(filenames):
+            fname = os.path.join(dirpath, fn)
+            if os.path.isfile(fname) and os.path.getsize(fname) > 0:
+                name = os.path.relpath(fname, root).replace(os.sep, '/')
+                members.append((prefix + name, fname))
+    return members
+
+def write_zip(zip_fname: str, members: List[Tuple[str, str]],
+              num_workers: Optional[int] = None):
+    """Write the (name in the archive, file path) members into zip_fname.
+
+    The members are compressed by num_workers processes. If zip_fname exists,
+    the compressed data of the members whose contents are not changed are
+    copied from it instead of being compressed again. zip_fname is replaced
+    only after the new archive is completely written. Archives need zip64,
+    namely larger than 4GB or with more than 65535 members, are written by
+    zipfile without compressing in parallel.
+    """
+    tmp_fname = zip_fname + '.tmp'
+    tik = time.time()
+    num_reused = 0
+    # an upper bound of the archive size, a member is stored if compressing
+    # doesn't make it smaller
+    size = sum([os.path.getsize(fname) + 2 * len(name.encode()) + 76
+                for name, fname in members]) + 22
+    try:
+        if len(members) >= 0xFFFF or size >= _ZIP64_SIZE:
+            raise _Zip64Error('too large')
+        num_reused = _write_zip(zip_fname, tmp_fname, members, num_workers)
+    except _Zip64Error:
+        logging.info(f'Writing {zip_fname} with zip64')
+        with zipfile.ZipFile(tmp_fname, 'w', zipfile.ZIP_DEFLATED,
+                             allowZip64=True, compresslevel=6) as zf:
+            for name, fname in members:
+                zf.write(fname, name)
+    os.replace(tmp_fname, zip_fname)
+    logging.info(f'Wrote {len(members)} files into {zip_fname} in '
+                 f'{time.time()-tik:.1f} sec, reused {num_reused} unchanged')
+
+class _Zip64Error(ValueError):
+    pass
+
+def _write_zip(zip_fname, tmp_fname, members, num_workers):
+    """Write members into tmp_fname, returns the number of reused members."""
+    old_infos = _read_infos(zip_fname)
+    num_reused = 0
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(zip_fname) or '.',
+                               prefix='.d2lbook_zip_')
+    old = open(zip_fname, 'rb') if old_infos else None
+    try:
+        with open(tmp_fname, 'wb') as out, \
+                concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+            entries = []
+            results = executor.map(
+                _compress, [fname for _, fname in members],
+                [old_infos.get(name) for name, _ in members],
+                [tmp_dir] * len(members), chunksize=16)
+            for (name, fname), (crc, size, method, data_fname) in zip(
+                    members, results):
+                if data_fname is None:
+                    info = old_infos[name]
+                    _seek_data(old, info)
+                    entries.append(_write_member(
+                        out, name, os.stat(fname), crc, size, info[4], old,
+                        info[3]))
+                    num_reused += 1
+                    continue
+                with open(data_fname, 'rb') as data:
+                    entries.append(_write_member(
+                        out, name, os.stat(fname), crc, size, method, data,
+                        os.path.getsize(data_fname)))
+                if data_fname != fname:
+                    os.remove(data_fname)
+            _write_central_directory(out, entries)
+    finally:
+        if old:
+            old.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return num_reused
+
+def _read_infos(zip_fname) -> Dict[str, Tuple]:
+    """Return the (crc, size, header offset, compressed size, method) of the
+    members in an existing archive."""
+    if not os.path.exists(zip_fname):
+        return {}
+    try:
+        with zipfile.ZipFile(zip_fname) as zf:
+            return {
+                info.filename: (info.CRC, info.file_size, info.header_offset,
+                                info.compress_size, info.compress_type)
+                for info in zf.infolist()
+                if info.compress_type in (zipfile.ZIP_STORED,
+                                          zipfile.ZIP_DEFLATED)}
+    except zipfile.BadZipFile:
+        logging.warning(f'Ignore the broken archive {zip_fname}')
+        return {}
+
+def _crc32(fname):
+    crc = 0
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _compress(fname, old_info, tmp_dir):
+    """Compress fname in chunks into a file in tmp_dir.
+
+    Return (crc, size, method, the file with the data to write). The file is
+    None if the content matches old_info, or fname if it's stored.
+    """
+    size = os.path.getsize(fname)
+    if old_info and old_info[1] == size:
+        crc = _crc32(fname)
+        if old_info[0] == crc:
+            return crc, size, None, None
+    crc, size = 0, 0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    fd, data_fname = tempfile.mkstemp(dir=tmp_dir)
+    with open(fname, 'rb') as f, os.fdopen(fd, 'wb') as out:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            out.write(compressor.compress(chunk))
+        out.write(compressor.flush())
+        compress_size = out.tell()
+    if compress_size >= size:
+        os.remove(data_fname)
+        return crc, size, zipfile.ZIP_STORED, fname
+    return crc, size, zipfile.ZIP_DEFLATED, data_fname
+
+def _seek_data(f, info):
+    """Seek to the compressed data of a member in an existing archive."""
+    header_offset = info[2]
+    f.seek(header_offset)
+    header = f.read(30)
+    name_len, extra_len = struct.unpack('<2H', header[26:30])
+    f.seek(header_offset + 30 + name_len + extra_len)
+
+def _dos_time(mtime):
+    t = time.localtime(mtime)
+    year = min(max(t.tm_year, 1980), 2107)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+def _write_member(out, name, stat, crc, size, method, data, compress_size):
+    """Write a member whose compress_size bytes of data are read from the
+    file object data in chunks."""
+    try:
+        name_bytes, flags = name.encode('ascii'), 0
+    except UnicodeEncodeError:
+        name_bytes, flags = name.encode('utf-8'), _UTF8_FLAG
+    if (out.tell() >= 0xFFFFFFFF or size >= 0xFFFFFFFF or
+            compress_size >= 0xFFFFFFFF):
+        raise _Zip64Error(f'{name} needs zip64')
+    dostime, dosdate = _dos_time(stat.st_mtime)
+    entry = (name_bytes, flags, method, dostime, dosdate, crc, compress_size,
+             size, (stat.st_mode & 0xFFFF) << 16, out.tell())
+    out.write(struct.pack(
+        '<4s5H3L2H', b'PK\x03\x04', _VERSION, flags, method, dostime, dosdate,
+        crc, compress_size, size, len(name_bytes), 0))
+    out.write(name_bytes)
+    while compress_size > 0:
+        chunk = data.read(min(compress_size, _CHUNK_SIZE))
+        if not chunk:
+            raise IOError(f'{name} is truncated')
+        out.write(chunk)
+        compress_size -= len(chunk)
+    return entry
+
+def _write_central_directory(out, entries):
+    start = out.tell()
+    for (name_bytes, flags, method, dostime, dosdate, crc, compress_size, size,
+         external_attr, offset) in entries:
+        out.write(struct.pack(
+            '<4s6H3L5H2L', b'PK\x01\x02', (3 << 8) | _VERSION, _VERSION,
+            flags, method, dostime, dosdate, crc, compress_size, size,
+            len(name_bytes), 0, 0, 0, 0, external_attr, offset))
+        out.write(name_bytes)
+    if len(entries) >= 0xFFFF or out.tell() >= 0xFFFFFFFF:
+        raise _Zip64Error('The central directory needs zip64')
+    out.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(entries),
+                          len(entries), out.tell() - start, start, 0))
@@ -0,0 +1,66 @@
+from d2lbook import archive
+import unittest
+import os
+import tempfile
+import zipfile
+
+class TestArchive(unittest.TestCase):
+    def _write(self, fname, content):
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'w') as f:
+            f.write(content)
+
+    def test_write_zip(self):
+        with tempfile.TemporaryDirectory() as root:
+            src = os.path.join(root, 'src')
+            self._write(os.path.join(src, 'a.ipynb'), 'a' * 1000)
+            self._write(os.path.join(src, 'ch/b.ipynb'), 'b')
+            with open(os.path.join(src, 'ch/c.png'), 'wb') as f:
+                f.write(os.urandom(3 << 20))
+            self._write(os.path.join(src, 'ch/empty.txt'), '')
+            self._write(os.path.join(src, '.hidden/c.txt'), 'c')
+            members = archive.list_files(src, 'tab/')
+            self.assertEqual([name for name, _ in members],
+                             ['tab/a.ipynb', 'tab/ch/b.ipynb', 'tab/ch/c.png'])
+            zip_fname = os.path.join(root, 'out.zip')
+            archive.write_zip(zip_fname, members, num_workers=2)
+            self._write(os.path.join(src, 'ch/b.ipynb'), 'bb')
+            with self.assertLogs() as logs:
+                archive.write_zip(zip_fname, members, num_workers=2)
+            self.assertIn('reused 2 unchanged', logs.output[0])
+            with zipfile.ZipFile(zip_fname) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(zf.read('tab/a.ipynb'), b'a' * 1000)
+                self.assertEqual(zf.read('tab/ch/b.ipynb'), b'bb')
+                self.assertEqual(zf.getinfo('tab/ch/c.png').compress_type,
+                                 zipfile.ZIP_STORED)
+            self.assertEqual(sorted(os.listdir(root)), ['out.zip', 'src'])
+
+    def test_list_links(self):
+        with tempfile.TemporaryDirectory() as root:
+            src = os.path.join(root, 'src')
+            self._write(os.path.join(root, 'data/d.csv'), 'd')
+            self._write(os.path.join(src, 'ch/a.ipynb'), 'a')
+            os.symlink(os.path.join(root, 'data'), os.path.join(src, 'data'))
+            os.symlink('..', os.path.join(src, 'ch/up'))
+            with self.assertLogs() as logs:
+                members = archive.list_files(src)
+            self.assertEqual([name for name, _ in members],
+                             ['ch/a.ipynb', 'data/d.csv'])
+            self.assertIn('a link to its parent directory', logs.output[0])
+
+    def test_zip64(self):
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'a.txt')
+            self._write(fname, 'a' * 1000)
+            zip_fname = os.path.join(root, 'out.zip')
+            size = archive._ZIP64_SIZE
+            archive._ZIP64_SIZE = 100
+            try:
+                with self.assertLogs() as logs:
+                    archive.write_zip(zip_fname, [('a.txt', fname)])
+            finally:
+                archive._ZIP64_SIZE = size
+            self.assertIn('with zip64', logs.output[0])
+            with zipfile.ZipFile(zip_fname) as zf:
+                self.assertEqual(zf.read('a.txt'), b'a' * 1000)
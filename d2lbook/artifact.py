@@ -0,0 +1,125 @@
+"""A content-addressed store to share build artifacts across machines"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import List, Optional
+
+from d2lbook import cache, utils
+from d2lbook._version import __version__
+
+# The file written last when pushing an artifact, an artifact without it is
+# incomplete and ignored.
+_MANIFEST = '.manifest'
+
+def get_key(*items):
+    """Return the key of an artifact generated from items.
+
+    The d2lbook version is included as the generated files may change across
+    versions.
+    """
+    return cache.hash_str(__version__, *items)
+
+def get_store(config):
+    """Return the artifact store specified in config, or None if not set."""
+    url = config.build['artifact_store']
+    if not url:
+        return None
+    return ArtifactStore(url, config.build['artifact_store_endpoint'],
+                         config.build['artifact_store_readonly'].lower() == 'true')
+
+class ArtifactStore():
+    """Save and load a set of files by a key, which is often the hash of the
+    inputs to generate these files.
+
+    url is either a local directory, which can be a shared network file system,
+    or a S3 URL such as s3://bucket/prefix. endpoint is the endpoint URL of a S3
+    compatible service such as MinIO. If readonly, then push is disabled, which
+    is useful for untrusted builds such as pull requests.
+    """
+    def __init__(self, url: str, endpoint: str = '', readonly: bool = False):
+        self.url = url.rstrip('/')
+        self._is_s3 = self.url.startswith('s3://')
+        self._endpoint = endpoint
+        self._readonly = readonly
+        self.num_pulled = 0
+        self.num_pushed = 0
+
+    def _path(self, key):
+        return '/'.join([self.url, key[:2], key])
+
+    def _aws(self, args):
+        cmd = ['aws', 's3'] + args + ['--quiet']
+        if self._endpoint:
+            cmd += ['--endpoint-url', self._endpoint]
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE).returncode == 0
+
+    def pull(self, key: str, tgt_dir: str) -> Optional[List[str]]:
+        """Copy the files saved under key into tgt_dir.
+
+        Returns the copied filenames, or None if key is not found.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = self._path(key)
+            if self._is_s3:
+                if not self._aws(['cp', '--recursive', src, tmp_dir]):
+                    return None
+            elif os.path.exists(os.path.join(src, _MANIFEST)):
+                shutil.rmtree(tmp_dir)
+                shutil.copytree(src, tmp_dir)
+            manifest = os.path.join(tmp_dir, _MANIFEST)
+            if not os.path.exists(manifest):
+                return None
+            with open(manifest, 'r') as f:
+                names = f.read().split('\n')
+            fnames = []
+            for name in names:
+                if not name:
+                    continue
+                fname = os.path.join(tgt_dir, name)
+                utils.mkdir(os.path.dirname(fname))
+                shutil.move(os.path.join(tmp_dir, name), fname)
+                fnames.append(fname)
+        self.num_pulled += 1
+        return fnames
+
+    def push(self, key: str, base_dir: str, fnames: List[str]):
+        """Save fnames, which are under base_dir, with key."""
+        if self._readonly:
+            return
+        names = [os.path.relpath(fn, base_dir) for fn in fnames]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for fn, name in zip(fnames, names):
+                utils.copy(fn, os.path.join(tmp_dir, name))
+            with open(os.path.join(tmp_dir, _MANIFEST), 'w') as f:
+                f.write('\n'.join(names))
+            tgt = self._path(key)
+            if self._is_s3:
+                # upload the manifest last so an interrupted push is ignored
+                ok = (self._aws([
+                    'cp', '--recursive', '--exclude', _MANIFEST, tmp_dir, tgt])
+                      and self._aws(['cp', os.path.join(tmp_dir, _MANIFEST),
+                                     tgt + '/' + _MANIFEST]))
+                if not ok:
+                    logging.warning(f'Failed to push artifact {key} to {tgt}')
+                    return
+            else:
+                if os.path.exists(tgt):
+                    return
+                # copy to a temporary folder and then rename it to be atomic
+                utils.mkdir(os.path.dirname(tgt))
+                tmp_tgt = tempfile.mkdtemp(dir=os.path.dirname(tgt))
+                shutil.rmtree(tmp_tgt)
+                shutil.copytree(tmp_dir, tmp_tgt)
+                try:
+                    os.rename(tmp_tgt, tgt)
+                except OSError:
+                    # pushed by others at the same time
+                    shutil.rmtree(tmp_tgt, ignore_errors=True)
+        self.num_pushed += 1
+
+    def summary(self, name):
+        logging.info(f'{name} artifacts: {self.num_pulled} pulled from, '
+                     f'{self.num_pushed} pushed to {self.url}')
@@ -0,0 +1,37 @@
+from d2lbook import artifact
+import unittest
+import tempfile
+import os
+
+class TestArtifact(unittest.TestCase):
+    def test_local_store(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = artifact.ArtifactStore(os.path.join(root, 'store'))
+            src_dir = os.path.join(root, 'src')
+            fnames = [os.path.join(src_dir, 'a.rst'),
+                      os.path.join(src_dir, 'img', 'a.svg')]
+            for fn in fnames:
+                os.makedirs(os.path.dirname(fn), exist_ok=True)
+                with open(fn, 'w') as f:
+                    f.write(fn)
+            key = artifact.get_key('rst', 'a.ipynb')
+            self.assertIsNone(store.pull(key, src_dir))
+            store.push(key, src_dir, fnames)
+            tgt_dir = os.path.join(root, 'tgt')
+            pulled = store.pull(key, tgt_dir)
+            self.assertEqual(sorted(pulled), sorted([
+                os.path.join(tgt_dir, 'a.rst'),
+                os.path.join(tgt_dir, 'img', 'a.svg')]))
+            with open(os.path.join(tgt_dir, 'img', 'a.svg')) as f:
+                self.assertEqual(f.read(), fnames[1])
+
+    def test_readonly(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = artifact.ArtifactStore(root, readonly=True)
+            fname = os.path.join(root, 'a.ipynb')
+            open(fname, 'w').close()
+            store.push('abcd', root, [fname])
+            self.assertIsNone(store.pull('abcd', root))
+
+if __name__ == '__main__':
+    unittest.main()
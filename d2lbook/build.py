@@ -1,6 +1,9 @@
 import argparse
 import datetime
+import functools
 import hashlib
+import io
+import json
 import logging
 import os
 import pathlib
@@ -9,14 +12,20 @@ import shutil
 import subprocess
 import sys
 import tarfile
+import tempfile
+import time
 import zipfile
 import requests
 
 import nbformat
-import notedown
 import regex
 
-from d2lbook import colab, library, markdown, notebook
+from d2lbook import archive, artifact
+from d2lbook import cache as cache_lib
+from d2lbook import colab, dag, execute, latex, library, markdown, notebook
+from d2lbook import dashboard as dashboard_lib
+from d2lbook import metrics, profiler
+from d2lbook import report as report_lib
 from d2lbook import rst as rst_lib
 from d2lbook import sagemaker
 from d2lbook.config import Config
@@ -29,18 +38,86 @@ __all__ = ['build']
 
 commands = [
     'eval', 'rst', 'html', 'pdf', 'pkg', 'linkcheck', 'ipynb', 'slides',
-    'outputcheck', 'tabcheck', 'lib', 'colab', 'sagemaker', 'all', 'merge']
+    'outputcheck', 'tabcheck', 'lib', 'colab', 'sagemaker', 'all', 'merge',
+    'doctrees', 'sphinxbench', 'report']
+
+# The commands that check the sources or use the build outputs, they don't run
+# in parallel with other commands
+_ordered_commands = ('outputcheck', 'tabcheck', 'lib', 'merge', 'sphinxbench',
+                     'report')
 
 def build():
     parser = argparse.ArgumentParser(description='Build the documents')
     parser.add_argument('commands', nargs='+', choices=commands)
     parser.add_argument('--tab', default=None,
                         help='The tab to build, if multi-tab is enabled.')
+    parser.add_argument(
+        '--tabs', default=None,
+        help='The tabs to evaluate together, seperated by ",", and then '
+        'build the merged results as --tab all.')
+    parser.add_argument(
+        '--dry-run', action='store_true',
+        help='Print the build stages without running them.')
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='The number of notebooks evaluated in parallel on CPUs, '
+        'overwrites eval_cpu_workers in config.ini.')
+    parser.add_argument(
+        '--gpus', type=int, default=None,
+        help='The number of GPUs to evaluate notebooks, overwrites '
+        'eval_gpu_workers in config.ini.')
+    parser.add_argument(
+        '--dashboard-port', type=int, default=None,
+        help='Serve the progress of evaluating notebooks at this local port, '
+        'overwrites eval_dashboard_port in config.ini.')
+    parser.add_argument(
+        '--sphinx-jobs', default=None,
+        help='The number of Sphinx processes, or auto to use all cores, '
+        'overwrites sphinx_jobs in config.ini.')
+    parser.add_argument(
+        '--profile', nargs='?', const='', default=None, metavar='FILE',
+        help='Record the time spent in each part of the build into FILE, '
+        'which is in the Chrome trace format, and print the hotspots. The '
+        'default FILE is trace.json in the output directory.')
     args = parser.parse_args(sys.argv[2:])
+    if args.tabs:
+        args.tab = 'all'
     config = Config(tab=args.tab)
+    if args.jobs is not None:
+        config.build['eval_cpu_workers'] = str(args.jobs)
+    if args.gpus is not None:
+        config.build['eval_gpu_workers'] = str(args.gpus)
+    if args.dashboard_port is not None:
+        config.build['eval_dashboard_port'] = str(args.dashboard_port)
+    if args.sphinx_jobs is not None:
+        config.build['sphinx_jobs'] = args.sphinx_jobs
     builder = Builder(config)
-    for cmd in args.commands:
-        getattr(builder, cmd)()
+    if args.tabs:
+        builder.eval_tabs = [tab.strip() for tab in args.tabs.lower().split(',')]
+    if args.profile is not None:
+        profiler.enable()
+    if not args.dry_run:
+        metrics.start_run(os.path.join(config.tgt_dir, metrics.DB_NAME),
+                          args.commands, args.tab)
+    status = 'failed'
+    try:
+        builder.run(args.commands, args.dry_run)
+        notebook.log_parsed_markdowns_summary()
+        if not args.dry_run:
+            notebook.prune_parsed_markdowns(
+                float(config.build['markdown_cache_days']))
+        status = 'ok'
+    finally:
+        if not args.dry_run:
+            try:
+                builder.record_metrics()
+            except Exception as e:
+                # don't hide the build error
+                logging.warning(f'Failed to record the build metrics: {e}')
+            metrics.finish_run(status)
+        if args.profile is not None:
+            profiler.save(args.profile or os.path.join(config.tgt_dir,
+                                                       'trace.json'))
 
 def _once(func):
     # An decorator that run a method only once
@@ -52,9 +129,12 @@ def _once(func):
             return
         full_name = 'd2lbook build ' + name
         tik = datetime.datetime.now()
-        func(self)
+        with profiler.span(name, 'stage'):
+            func(self)
+        tok = datetime.datetime.now()
         logging.info('=== Finished "%s" in %s', full_name,
-                     get_time_diff(tik, datetime.datetime.now()))
+                     get_time_diff(tik, tok))
+        metrics.record_stage(name, (tok - tik).total_seconds())
         self.done[name] = True
 
     return warp
@@ -63,22 +143,98 @@ class Builder(object):
     def __init__(self, config):
         self.config = config
         mkdir(self.config.tgt_dir)
-        self.sphinx_opts = '-j 4'
-        if config.build['warning_is_error'].lower() == 'true':
+        self.sphinx_jobs = _get_sphinx_jobs(config.build['sphinx_jobs'])
+        self.sphinx_warning_is_error = config.build[
+            'warning_is_error'].lower() == 'true'
+        self.sphinx_opts = f'-j {self.sphinx_jobs}'
+        if self.sphinx_warning_is_error:
             self.sphinx_opts += ' -W'
         self.done = {}
+        # the tabs to evaluate if tab is all, the default is all tabs
+        self.eval_tabs = None
         self._colab = colab.Colab(config)
         self._sagemaker = sagemaker.Sagemaker(config)
+        notebook.set_parsed_markdowns_dir(
+            os.path.join(config.cache_dir, 'markdown'))
+
+    def _stage_deps(self, stage):
+        """The stages need to be built before stage."""
+        deps = {
+            'rst': ['merge' if self.config.tab == 'all' else 'eval'],
+            'ipynb': ['eval'], 'colab': ['ipynb'], 'sagemaker': ['ipynb'],
+            'doctrees': ['rst'], 'html': ['doctrees', 'colab', 'sagemaker'],
+            'linkcheck': ['doctrees'], 'pdf': ['doctrees'], 'pkg': ['ipynb'],
+            'slides': ['eval'], 'sphinxbench': ['rst'],
+            'all': ['eval', 'rst', 'html', 'pdf', 'pkg']}
+        return deps.get(stage, [])
+
+    def _is_done(self, stage):
+        # ipynb is built for every tab, see _run_stage
+        if stage in ('ipynb', 'all'):
+            return False
+        name = stage + ('_' + self.config.tab if self.config.tab else '')
+        return self.done.get(name, False)
+
+    def _run_stage(self, stage):
+        if stage == 'ipynb':
+            # colab and sagemaker need the notebooks of all tabs
+            self.config.iter_tab(self.ipynb)
+        elif stage != 'all':
+            getattr(self, stage)()
+        return self.done
+
+    def run(self, commands, dry_run=False):
+        """Build commands and the stages they depend on.
+
+        Stages that don't depend on each other, such as html and pdf after rst,
+        run in parallel. The other commands, such as tabcheck and lib, run in
+        the command line order.
+        """
+        graph = dag.Graph(commands, self._stage_deps)
+        if self.config.tab == 'all' and 'merge' in graph.deps and (
+                'eval' in graph.deps):
+            # eval with all tabs merges the notebooks in the end
+            graph.add_dep('merge', 'eval')
+        # an ordered command runs after the stages of the previous commands,
+        # and before the stages only needed by the next commands
+        previous, barrier = set(), None
+        for command in commands:
+            stages = [s for s in graph.order
+                      if s == command or graph.depends(command, s)]
+            if command in _ordered_commands:
+                for stage in reversed(graph.order):
+                    if (stage in previous and stage != command and
+                            not graph.depends(stage, command) and
+                            not graph.depends(command, stage)):
+                        graph.add_dep(command, stage)
+                barrier = command
+            elif barrier:
+                for stage in stages:
+                    if (stage not in previous and stage != barrier and
+                            not graph.depends(barrier, stage) and
+                            not graph.depends(stage, barrier)):
+                        graph.add_dep(stage, barrier)
+            previous.update(stages)
+        logging.info('Build stages:\n' + graph.describe())
+        if dry_run:
+            return
+        failed = graph.run(self._run_stage,
+                           lambda stage, done: self.done.update(done),
+                           self._is_done)
+        if failed:
+            logging.error(f'Failed to build {", ".join(failed)}')
+            exit(-1)
 
     def _find_md_files(self):
         build = self.config.build
         src_dir = self.config.src_dir
-        notebooks = find_files(
-            build['notebooks'], src_dir,
-            build['exclusions'] + ' ' + build['non-notebooks'])
-        pure_markdowns = find_files(build['non-notebooks'], src_dir,
-                                    build['exclusions'])
-        depends = find_files(build['dependencies'], src_dir)
+        with profiler.span('find markdown files', 'discovery'):
+            notebooks = find_files(
+                build['notebooks'], src_dir,
+                build['exclusions'] + ' ' + build['non-notebooks'])
+            pure_markdowns = find_files(build['non-notebooks'], src_dir,
+                                        build['exclusions'])
+            depends = find_files(build['dependencies'], src_dir)
         return sorted(notebooks), sorted(pure_markdowns), sorted(depends)
 
     def _get_updated_md_files(self):
@@ -94,12 +250,41 @@ class Builder(object):
                                               latest_depend)
         return updated_notebooks, updated_markdowns
 
+    def record_metrics(self):
+        """Record the sizes of the outputs built by this run and the markdown
+        parsing stats."""
+        counters = {f'parsed_markdowns_{k}': v
+                    for k, v in notebook.parsed_markdowns_stats.items()}
+
+        def _record_sizes():
+            suffix = f'_{self.config.tab}' if self.config.tab else ''
+            for name in ('eval', 'rst', 'html', 'pdf', 'ipynb', 'colab',
+                         'sagemaker', 'slides'):
+                path = getattr(self.config, name + '_dir')
+                if self.done.get(name + suffix) and os.path.exists(path):
+                    counters[f'{name}{suffix}_bytes'] = metrics.get_size(path)
+
+        self.config.iter_tab(_record_sizes)
+        if any([k == 'pkg' or k.startswith('pkg_') for k in self.done]) and (
+                os.path.exists(self.config.pkg_fname)):
+            counters['pkg_bytes'] = metrics.get_size(self.config.pkg_fname)
+        metrics.record_counters(counters)
+
+    def report(self):
+        """Log the slowest cells and the largest outputs of the evaluated
+        notebooks."""
+        def _report():
+            cells = report_lib.collect(self.config.eval_dir)
+            logging.info(f'Report of {self.config.eval_dir}:\n' +
+                         report_lib.format_report(cells))
+
+        self.config.iter_tab(_report)
+
     def tabcheck(self):
         notebooks, _, _ = self._find_md_files()
         error = False
         for fn in notebooks:
-            with open(fn, 'r') as f:
-                nb = notebook.read_markdown(f.read())
+            nb = notebook.read_markdown_file(fn)
             nb = notebook.split_markdown_cell(nb)
             for c in nb.cells:
                 tabs = notebook.get_cell_tab(c)
@@ -113,60 +298,207 @@ class Builder(object):
 
     def outputcheck(self):
         notebooks, _, _ = self._find_md_files()
-        reader = notedown.MarkdownReader()
         error = False
         for fn in notebooks:
-            with open(fn, 'r') as f:
-                notebook = reader.read(f)
-            for c in notebook.cells:
+            nb = notebook.read_markdown_file(fn, match='all')
+            for c in nb.cells:
                 if 'outputs' in c and len(c['outputs']):
                     logging.error("Found execution outputs in %s", fn)
                     error = True
         if error:
             exit(-1)
 
-    @_once
-    def eval(self):
-        """Evaluate the notebooks and save them in a different folder"""
-        # TODO(mli) if tabs is enabled, and a .md doesn't have the default tab,
-        # then the current implementation will not run the eval.
-        os.environ['PYTHONWARNINGS']='ignore'
-        eval_tik = datetime.datetime.now()
+    def _eval_env_hash(self, depends):
+        """Hash the inputs that affect all notebooks in a tab."""
+        items = [self.config.tab or '']
+        for key in ('eval_notebook', 'tabs'):
+            items.append(key + '=' + self.config.build[key])
+        # the alias in [library-TAB] is replaced before evaluating
+        if self.config.tab:
+            items.append('library=' + json.dumps(
+                self.config.library.get(self.config.tab), sort_keys=True))
+        for fn in depends:
+            items.append(fn + '=' + cache_lib.hash_file(fn))
+        return cache_lib.hash_str(*items)
+
+    def _start_kernel_pool(self, tabs):
+        """Start warm kernels for tabs if eval_kernel_pool_size > 0."""
+        size = int(self.config.build['eval_kernel_pool_size'])
+        if not tabs or size <= 0:
+            return None
+        preloads = {}
+        for tab in tabs:
+            library = self.config.library.get(tab, {}) if tab else self.config.library
+            preloads[tab or ''] = library.get('preload', '')
+        kernel_pool = execute.KernelPool(size, preloads)
+        for tab in preloads:
+            kernel_pool.start(tab)
+        return kernel_pool
+
+    def _find_outdated_notebooks(self):
+        """Return the notebooks of the current tab need to be evaluated."""
         notebooks, pure_markdowns, depends = self._find_md_files()
         depends_mtimes = get_mtimes(depends)
         latest_depend = max(depends_mtimes) if len(depends_mtimes) else 0
-        updated_notebooks = get_updated_files(notebooks, self.config.src_dir,
-                                              self.config.eval_dir, 'md',
-                                              'ipynb', latest_depend)
+        # Notebooks are outdated if the hash of their effective inputs, namely
+        # the tab notebook with alias replaced, the config and the dependencies,
+        # is changed. The modification time is only used for the targets built
+        # before the cache existed.
+        mtime_updated = set(
+            tgt for _, tgt in get_updated_files(
+                notebooks, self.config.src_dir, self.config.eval_dir, 'md',
+                'ipynb', latest_depend))
+        cache = cache_lib.Cache(
+            os.path.join(self.config.cache_dir,
+                         os.path.basename(self.config.eval_dir) + '.json'))
+        env_hash = self._eval_env_hash(depends)
+        store = artifact.get_store(self.config)
+        run_cells = self.config.build['eval_notebook'].lower() == 'true'
+        updated_notebooks = []
+        for src in notebooks:
+            tgt = get_tgt_fname(self.config.src_dir, src,
+                                self.config.eval_dir, 'md', 'ipynb')
+            src_hash = cache_lib.hash_file(src)
+            entry = cache.get(tgt)
+            if (os.path.exists(tgt) and entry and entry['env'] == env_hash
+                    and entry['source'] == src_hash):
+                cache.hit(tgt)
+                continue
+            nb = _read_tab_notebook(src, self.config)
+            key = {
+                'source': src_hash, 'env': env_hash,
+                'input': _notebook_hash(nb),
+                'code': _code_hash(nb)}
+            if os.path.exists(tgt) and (
+                (entry and entry['env'] == env_hash and
+                 entry['input'] == key['input']) or
+                (not entry and tgt not in mtime_updated)):
+                cache.set(tgt, key)
+                cache.hit(tgt)
+                continue
+            # Only the markdown cells are changed, reuse the previous outputs
+            # without starting a kernel.
+            if (run_cells and nb and entry and entry['env'] == env_hash and
+                    entry.get('code') == key['code'] and
+                    _reuse_outputs(nb, tgt)):
+                logging.info(f'Reuse the code outputs in {tgt} for {src}')
+                cache.set(tgt, key)
+                cache.hit(tgt)
+                continue
+            if store and nb and store.pull(
+                    artifact.get_key('eval', tgt, env_hash, key['input']),
+                    os.path.dirname(tgt)):
+                logging.info(f'Pulled {tgt} from {store.url}')
+                cache.set(tgt, key)
+                cache.hit(tgt)
+                continue
+            cache.miss(tgt)
+            updated_notebooks.append((src, tgt, nb, key))
         updated_markdowns = get_updated_files(pure_markdowns,
                                               self.config.src_dir,
                                               self.config.eval_dir, 'md', 'md',
                                               latest_depend)
-        num_updated_notebooks = len(updated_notebooks)
-        num_updated_markdowns = len(updated_markdowns)
-        logging.info('%d notebooks are outdated', num_updated_notebooks)
+        logging.info('%d notebooks are outdated', len(updated_notebooks))
         for i, nb in enumerate(updated_notebooks):
             logging.info('[%d] %s', i + 1, nb[0])
-        self._copy_resources(self.config.src_dir, self.config.eval_dir)
-        gpus = resource.get_available_gpus()
-        num_cpu_workers = len(gpus) if gpus else 2
+        return cache, store, updated_notebooks, updated_markdowns
+
+    @_once
+    def eval(self):
+        """Evaluate the notebooks and save them in a different folder
+
+        If tab is all, then evaluate the notebooks of every tab with a single
+        scheduler, and then merge them.
+        """
+        # TODO(mli) if tabs is enabled, and a .md doesn't have the default tab,
+        # then the current implementation will not run the eval.
+        os.environ['PYTHONWARNINGS']='ignore'
+        eval_tik = datetime.datetime.now()
+        current_tab = self.config.tab
+        tabs = [current_tab]
+        if current_tab == 'all':
+            tabs = self.eval_tabs or self.config.tabs
+        outdated = {}
+        for tab in tabs:
+            self.config.set_tab(tab)
+            outdated[tab] = self._find_outdated_notebooks()
+            self._copy_resources(self.config.src_dir, self.config.eval_dir)
+        run_cells = self.config.build['eval_notebook'].lower() == 'true'
+        build = self.config.build
+        num_gpu_workers = build['eval_gpu_workers']
+        num_gpu_workers = (int(num_gpu_workers) if num_gpu_workers else len(
+            resource.get_available_gpus()))
+        num_cpu_workers = build['eval_cpu_workers']
+        num_cpu_workers = (int(num_cpu_workers) if num_cpu_workers else
+                           num_gpu_workers if num_gpu_workers else 2)
+        assert num_cpu_workers > 0, 'eval_cpu_workers must be positive'
+        memory = build['eval_memory']
+        memory = float(memory) if memory else resource.get_total_memory()
         logging.info(
-            f'Evaluating notebooks in parallel with {num_cpu_workers} CPU workers and {len(gpus)} GPU workers'
+            f'Evaluating notebooks in parallel with {num_cpu_workers} CPU workers, {num_gpu_workers} GPU workers and {memory:.1f}GB memory'
         )
-        scheduler = resource.Scheduler(num_cpu_workers, len(gpus))
-        run_cells = self.config.build['eval_notebook'].lower() == 'true'
-        for i, (src, tgt) in enumerate(updated_notebooks):
-            mkdir(os.path.dirname(tgt))
-            _process_and_eval_notebook(scheduler, src, tgt, run_cells,
-                                       self.config)
-        scheduler.run()
+        kernel_pool = self._start_kernel_pool([
+            tab for tab in tabs if run_cells and outdated[tab][2]])
+        port = build['eval_dashboard_port']
+        dashboard = dashboard_lib.Dashboard(
+            os.path.join(self.config.tgt_dir, dashboard_lib.STATUS_NAME),
+            int(port) if port else None)
+        scheduler = resource.Scheduler(
+            num_cpu_workers, num_gpu_workers,
+            os.path.join(self.config.cache_dir, 'tasks.json'), kernel_pool,
+            memory, float(build['eval_memory_per_notebook']), dashboard,
+            float(build['eval_stall_timeout']))
+
+        def _evaluated(cache, store, tgt, key):
+            cache.set(tgt, key)
+            if store and os.path.getsize(tgt) > 0:
+                store.push(
+                    artifact.get_key('eval', tgt, key['env'], key['input']),
+                    os.path.dirname(tgt), [tgt])
+
+        for tab in tabs:
+            self.config.set_tab(tab)
+            cache, store, updated_notebooks, _ = outdated[tab]
+            for src, tgt, nb, key in updated_notebooks:
+                mkdir(os.path.dirname(tgt))
+                _process_and_eval_notebook(
+                    scheduler, nb, src, tgt, run_cells, self.config,
+                    callback=functools.partial(_evaluated, cache, store, tgt,
+                                               key))
+        try:
+            scheduler.run()
+        finally:
+            dashboard.close()
+            if kernel_pool:
+                kernel_pool.shutdown()
+            metrics.record_notebooks(scheduler.task_stats)
+        counters = {'eval_utilization': scheduler.utilization}
+        for tab in tabs:
+            self.config.set_tab(tab)
+            cache, store, _, updated_markdowns = outdated[tab]
+            cache.save()
+            cache.summary(f'Eval {tab}' if tab else 'Eval')
+            name = f'eval_{tab}' if tab else 'eval'
+            counters[name + '_cache_hits'] = len(cache.hits)
+            counters[name + '_cache_misses'] = len(cache.misses)
+            if store:
+                store.summary(f'Eval {tab}' if tab else 'Eval')
+        metrics.record_counters(counters)
         assert not scheduler.failed_tasks, scheduler.error_message
 
-        for src, tgt in updated_markdowns:
-            logging.info('Copying %s to %s', src, tgt)
-            mkdir(os.path.dirname(tgt))
-            shutil.copyfile(src, tgt)
-        self._rm_tgt_files('md', 'ipynb', self.config.eval_dir)
+        for tab in tabs:
+            self.config.set_tab(tab)
+            _, _, _, updated_markdowns = outdated[tab]
+            for src, tgt in updated_markdowns:
+                logging.info('Copying %s to %s', src, tgt)
+                mkdir(os.path.dirname(tgt))
+                shutil.copyfile(src, tgt)
+            self._rm_tgt_files('md', 'ipynb', self.config.eval_dir)
+            if tab != current_tab:
+                self.done['eval_' + tab] = True
+        self.config.set_tab(current_tab)
+        if current_tab == 'all':
+            self.merge()
 
     # Remove target files (e.g., eval and rst) based on removed files under src
     def _rm_tgt_files(self, src_ext, tgt_ext, tgt_dir, must_incls=None):
@@ -301,11 +633,8 @@ class Builder(object):
                                               self.config.slides_dir, 'ipynb',
                                               'ipynb')
         sd = Slides(self.config)
-        for src, tgt in updated_notebooks:
-            nb = notebook.read(src)
-            if not nb:
-                continue
-            sd.generate(nb, tgt)
+        parallel_map(functools.partial(_generate_slides, sd),
+                     updated_notebooks)
         sd.generate_readme()
 
     @_once
@@ -320,10 +649,23 @@ class Builder(object):
                                               self.config.rst_dir, 'ipynb',
                                               'rst')
         logging.info('%d rst files are outdated', len(updated_notebooks))
-        for src, tgt in updated_notebooks:
-            logging.info('Convert %s to %s', src, tgt)
-            mkdir(os.path.dirname(tgt))
-            ipynb2rst(src, tgt)
+        store = artifact.get_store(self.config)
+        keys, pulled = {}, set()
+        if store:
+            for src, tgt in updated_notebooks:
+                keys[tgt] = artifact.get_key('rst', src, tgt,
+                                             cache_lib.hash_file(src))
+                if store.pull(keys[tgt], os.path.dirname(tgt)):
+                    logging.info(f'Pulled {tgt} from {store.url}')
+                    pulled.add(tgt)
+            updated_notebooks = [(src, tgt) for src, tgt in updated_notebooks
+                                 if tgt not in pulled]
+        all_fnames = parallel_map(_ipynb2rst, updated_notebooks)
+        for (_, tgt), fnames in zip(updated_notebooks, all_fnames):
+            if store and fnames:
+                store.push(keys[tgt], os.path.dirname(tgt), fnames)
+        if store:
+            store.summary('Rst')
         # Generate conf.py under rst folder
         prepare_sphinx_env(self.config)
         self._copy_rst()
@@ -337,14 +679,73 @@ class Builder(object):
         self._rm_tgt_files('md', 'rst', self.config.rst_dir,
                            must_incl_rst_files)
 
+    def _sphinx_build(self, builder, out_dir):
+        """Run a sphinx builder on rst_dir with the shared doctrees."""
+        if self.config.build['sphinx_in_process'].lower() == 'true':
+            from sphinx.application import Sphinx
+            logging.info(f'Running sphinx builder "{builder}" in process')
+            app = Sphinx(self.config.rst_dir, self.config.rst_dir, out_dir,
+                         self.config.doctree_dir, builder,
+                         warningiserror=self.sphinx_warning_is_error,
+                         parallel=self.sphinx_jobs)
+            tik = time.time()
+
+            def _env_updated(app, env):
+                profiler.add_span(f'sphinx {builder} read', tik,
+                                  time.time() - tik, 'sphinx')
+
+            app.connect('env-updated', _env_updated)
+            with profiler.span(f'sphinx {builder}', 'sphinx'):
+                app.build()
+            if app.statuscode:
+                logging.error(f'Sphinx builder "{builder}" failed')
+                exit(-1)
+        else:
+            with profiler.span(f'sphinx {builder}', 'sphinx'):
+                run_cmd([
+                    'sphinx-build', self.config.rst_dir, out_dir, '-b',
+                    builder, '-c', self.config.rst_dir, '-d',
+                    self.config.doctree_dir, self.sphinx_opts])
+
     @_once
-    def html(self):
+    def sphinxbench(self):
+        """Time the html builder with different numbers of Sphinx jobs.
+
+        Each run parses all rst files from scratch, reading is the phase until
+        the doctrees are pickled, writing is the rest.
+        """
         self.rst()
+        cores = os.cpu_count() or 1
+        jobs = sorted(set([2**i for i in range(cores.bit_length())] + [cores]))
+        logging.info(f'Benchmarking sphinx with {jobs} jobs on {cores} cores')
+        rows = []
+        for n in jobs:
+            read, total = _time_sphinx_build(self.config.rst_dir, 'html', n)
+            logging.info(f'{n} jobs: read {read:.1f} sec, '
+                         f'write {total-read:.1f} sec')
+            rows.append((n, read, total - read, total))
+        best = min(rows, key=lambda row: row[3])
+        logging.info('Sphinx timings in seconds:\n' + '\n'.join(
+            [f'{"jobs":>6}{"read":>10}{"write":>10}{"total":>10}'] +
+            [f'{n:>6}{r:>10.1f}{w:>10.1f}{t:>10.1f}' for n, r, w, t in rows]))
+        logging.info(f'The fastest is {best[0]} jobs, set "sphinx_jobs = '
+                     f'{best[0]}" in the [build] section of config.ini')
+
+    @_once
+    def doctrees(self):
+        # Parse the rst files once, the html, latex and linkcheck builders
+        # then only read the pickled doctrees. It also avoids these builders,
+        # which may run in parallel, writing the doctrees at the same time.
+        self.rst()
+        with tempfile.TemporaryDirectory() as out_dir:
+            self._sphinx_build('dummy', out_dir)
+
+    @_once
+    def html(self):
+        self.doctrees()
         self.colab()
         self.sagemaker()
-        run_cmd([
-            'sphinx-build', self.config.rst_dir, self.config.html_dir,
-            '-b html -c', self.config.rst_dir, self.sphinx_opts])
+        self._sphinx_build('html', self.config.html_dir)
         self._colab.add_button(self.config.html_dir)
 
     def _default_tab_dir(self, dirname):
@@ -357,10 +758,8 @@ class Builder(object):
     @_once
     def ipynb(self):
         self.eval()
-        run_cmd([
-            'rm -rf', self.config.ipynb_dir, '; cp -r ', self.config.eval_dir,
-            self.config.ipynb_dir])
-        update_ipynb_toc(self.config.ipynb_dir)
+        sync_dir(self.config.eval_dir, self.config.ipynb_dir, _IPYNB_SYNC_KEY,
+                 _update_ipynb_toc)
 
     @_once
     def colab(self):
@@ -384,43 +783,35 @@ class Builder(object):
 
     @_once
     def linkcheck(self):
-        self.rst()
-        run_cmd([
-            'sphinx-build', self.config.rst_dir, self.config.linkcheck_dir,
-            '-b linkcheck -c', self.config.rst_dir, self.sphinx_opts])
+        self.doctrees()
+        self._sphinx_build('linkcheck', self.config.linkcheck_dir)
 
     @_once
     def pdf(self):
-        self.rst()
-        run_cmd([
-            'sphinx-build ', self.config.rst_dir, self.config.pdf_dir,
-            '-b latex -c', self.config.rst_dir, self.sphinx_opts])
+        self.doctrees()
+        self._sphinx_build('latex', self.config.pdf_dir)
 
         script = self.config.pdf['post_latex']
         process_latex(self.config.tex_fname, script)
-        run_cmd(['cd', self.config.pdf_dir, '&& make'])
+        latex.compile_pdf(self.config.tex_fname)
         if self.config.tab != self.config.default_tab:
             p = self.config.project['name']
             run_cmd(['cd', self.config.pdf_dir, '&& cp ', p+'.pdf', p+'-'+self.config.tab+'.pdf' ])
 
     @_once
     def pkg(self):
-        zip_fname = 'out.zip'
         if not self.config.tabs:
             self.ipynb()
-            run_cmd(['cd', self.config.ipynb_dir, '&& find . -size 0 -delete && zip -r', zip_fname, '*'])
-            shutil.move(os.path.join(self.config.ipynb_dir, zip_fname),
-                        self.config.pkg_fname)
+            members = archive.list_files(self.config.ipynb_dir)
         else:
+            members = []
             origin_tab = self.config.tab
             for tab in self.config.tabs:
                 self.config.set_tab(tab)
                 self.ipynb()
-                run_cmd(['rm -rf', tab])
-                run_cmd(['cp -r', self.config.ipynb_dir, tab])
-            run_cmd(['zip -r', zip_fname] + self.config.tabs)
-            shutil.move(zip_fname, self.config.pkg_fname)
+                members += archive.list_files(self.config.ipynb_dir, tab + '/')
             self.config.set_tab(origin_tab)
+        archive.write_zip(self.config.pkg_fname, members)
 
     @_once
     def lib(self):
@@ -464,61 +855,183 @@ class Builder(object):
         self.pdf()
         self.pkg()
 
+def _get_sphinx_jobs(value):
+    value = value.strip().lower()
+    return (os.cpu_count() or 1) if value == 'auto' else int(value)
+
+def _time_sphinx_build(rst_dir, builder, jobs):
+    """Return the seconds to read the documents and the total seconds."""
+    from sphinx.application import Sphinx
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = Sphinx(rst_dir, rst_dir, os.path.join(tmp_dir, 'out'),
+                     os.path.join(tmp_dir, 'doctrees'), builder, status=None,
+                     warning=io.StringIO(), parallel=jobs)
+        times = {}
+
+        def _env_updated(app, env):
+            times['read'] = time.time() - tik
+
+        app.connect('env-updated', _env_updated)
+        tik = time.time()
+        app.build()
+        return times.get('read', 0), time.time() - tik
+
 def update_ipynb_toc(root):
     """Change the toc code block into a list of clickable links"""
-    notebooks = find_files('**/*.ipynb', root)
-    for fn in notebooks:
-        nb = notebook.read(fn)
-        if not nb:
-            continue
-        for cell in nb.cells:
-            if (cell.cell_type == 'markdown' and '```toc' in cell.source):
-                md_cells = markdown.split_markdown(cell.source)
-                for c in md_cells:
-                    if c['type'] == 'code' and c['class'] == 'toc':
-                        toc = []
-                        for l in c['source'].split('\n'):
-                            if l and not l.startswith(':'):
-                                toc.append(' - [%s](%s.ipynb)' % (l, l))
-                        c['source'] = '\n'.join(toc)
-                        c['type'] = 'markdown'
-                cell.source = markdown.join_markdown_cells(md_cells)
-        with open(fn, 'w') as f:
-            f.write(nbformat.writes(nb))
-
-def _process_and_eval_notebook(scheduler, input_fn, output_fn, run_cells,
-                               config, timeout=20 * 60, lang='python'):
-    with open(input_fn, 'r') as f:
-        md = f.read()
-    nb = notebook.read_markdown(md)
+    parallel_map(_update_ipynb_toc, find_files('**/*.ipynb', root))
+
+# Update it once _update_ipynb_toc changes to update all notebooks
+_IPYNB_SYNC_KEY = 'toc, no cell stats'
+
+def _update_ipynb_toc(fn):
+    nb = notebook.read(fn)
+    if not nb:
+        return
+    for cell in nb.cells:
+        # the cell statistics are only for d2lbook build report, don't ship
+        # them to readers through the ipynb, colab, sagemaker and pkg outputs
+        cell.metadata.pop('d2lbook', None)
+        if (cell.cell_type == 'markdown' and '```toc' in cell.source):
+            md_cells = markdown.split_markdown(cell.source)
+            for c in md_cells:
+                if c['type'] == 'code' and c['class'] == 'toc':
+                    toc = []
+                    for l in c['source'].split('\n'):
+                        if l and not l.startswith(':'):
+                            toc.append(' - [%s](%s.ipynb)' % (l, l))
+                    c['source'] = '\n'.join(toc)
+                    c['type'] = 'markdown'
+            cell.source = markdown.join_markdown_cells(md_cells)
+    with open(fn, 'w') as f:
+        f.write(nbformat.writes(nb))
+
+def _read_tab_notebook(input_fn, config):
+    """Read a markdown file into the notebook to evaluate for config.tab.
+
+    Returns None if the notebook has no cell for this tab.
+    """
+    nb = notebook.read_markdown_file(input_fn)
     tab = config.tab
     if tab:
         # get the tab
-        nb = notebook.split_markdown_cell(nb)
-        nb = notebook.get_tab_notebook(nb, tab, config.default_tab)
+        with profiler.span(f'split tab {input_fn}', 'tab'):
+            nb = notebook.split_markdown_cell(nb)
+            nb = notebook.get_tab_notebook(nb, tab, config.default_tab)
         if not nb:
-            logging.info(f"Skip to eval tab {tab} for {input_fn}")
-            # write an empty file to track the dependencies
-            open(output_fn, 'w')
-            return
+            return None
         # replace alias
         if tab in config.library:
-            nb = library.replace_alias(nb, config.library[tab])
-    nb = library.format_code_nb(nb)
+            with profiler.span(f'replace alias {input_fn}', 'alias'):
+                nb = library.replace_alias(nb, config.library[tab])
+    with profiler.span(f'format code {input_fn}', 'format'):
+        return library.format_code_nb(nb)
+
+def _notebook_hash(nb):
+    """Hash the cells in a notebook, ignoring the randomly generated cell ids."""
+    if not nb:
+        return ''
+    return cache_lib.hash_str(*[
+        json.dumps([cell.cell_type, cell.source, cell.metadata], sort_keys=True)
+        for cell in nb.cells])
+
+def _code_hash(nb):
+    """Hash the sources of all code cells in a notebook."""
+    if not nb:
+        return ''
+    return cache_lib.hash_str(
+        *[cell.source for cell in nb.cells if cell.cell_type == 'code'])
+
+def _reuse_outputs(nb, output_fn, lang='python'):
+    """Copy the code outputs in output_fn into nb and save it into output_fn.
+
+    Returns False if the code cells in output_fn don't match the ones in nb.
+    """
+    old_nb = notebook.read(output_fn)
+    if not old_nb:
+        return False
+    code_cells = [cell for cell in nb.cells if cell.cell_type == 'code']
+    old_code_cells = [
+        cell for cell in old_nb.cells if cell.cell_type == 'code']
+    if len(code_cells) != len(old_code_cells):
+        return False
+    for cell, old_cell in zip(code_cells, old_code_cells):
+        if cell.source != old_cell.source:
+            return False
+    for cell, old_cell in zip(code_cells, old_code_cells):
+        cell['outputs'] = old_cell.get('outputs', [])
+        cell['execution_count'] = old_cell.get('execution_count')
+        for key in ('execution', 'd2lbook'):
+            if key in old_cell.metadata:
+                cell.metadata[key] = old_cell.metadata[key]
+    for k, v in old_nb.metadata.items():
+        if k not in nb.metadata:
+            nb.metadata[k] = v
+    _job(nb, output_fn, False, None, lang)
+    return True
+
+def _process_and_eval_notebook(scheduler, nb, input_fn, output_fn, run_cells,
+                               config, lang='python', callback=None):
+    if not nb:
+        logging.info(f"Skip to eval tab {config.tab} for {input_fn}")
+        # write an empty file to track the dependencies
+        open(output_fn, 'w')
+        if callback:
+            callback()
+        return
 
+    description = f'Evaluating {input_fn}'
+    if config.tab:
+        description += f' for tab {config.tab}'
+    build = config.build
+    timeout = int(build['eval_cell_timeout'])
     if not run_cells:
         logging.info(f'Converting {input_fn} to {output_fn}')
         _job(nb, output_fn, run_cells, timeout, lang)
+        if callback:
+            callback()
     else:
-        # use at most 2 gpus to eval a notebook
-        num_gpus = resource.get_notebook_gpus(nb, 2)
-        scheduler.add(1, num_gpus, target=_job,
+        resources = resource.get_notebook_resources(nb)
+        num_gpus = resources.get('gpus', resource.get_notebook_gpus(
+            nb, int(build['eval_max_gpus_per_notebook'])))
+        num_cpus = resources.get('cpus', 1)
+        notebook_timeout = resource.get_notebook_timeout(nb)
+        if notebook_timeout is None:
+            notebook_timeout = int(build['eval_notebook_timeout'])
+        # the number of workers may be smaller than the requested, e.g. a
+        # GPU notebook is evaluated on CPUs
+        if (num_cpus > scheduler.num_cpu_workers or
+                num_gpus > scheduler.num_gpu_workers):
+            logging.warning(
+                f'{input_fn} needs {num_cpus} CPUs and {num_gpus} GPUs, more '
+                f'than the {scheduler.num_cpu_workers} CPU and '
+                f'{scheduler.num_gpu_workers} GPU workers')
+            num_cpus = min(num_cpus, scheduler.num_cpu_workers)
+            num_gpus = min(num_gpus, scheduler.num_gpu_workers)
+        if not num_gpus:
+            # e.g. cpus=0, gpus=1 on a machine without GPUs
+            num_cpus = max(num_cpus, 1)
+        scheduler.add(num_cpus, num_gpus, target=_job,
                       args=(nb, output_fn, run_cells, timeout, lang),
-                      description=f'Evaluating {input_fn}')
+                      description=description,
+                      callback=callback, name=output_fn,
+                      kernel=config.tab or '', memory=resources.get('memory'),
+                      timeout=notebook_timeout)
+
+def _ipynb2rst(fnames):
+    input_fn, output_fn = fnames
+    logging.info('Convert %s to %s', input_fn, output_fn)
+    mkdir(os.path.dirname(output_fn))
+    return ipynb2rst(input_fn, output_fn)
+
+def _generate_slides(sd, fnames):
+    nb = notebook.read(fnames[0])
+    if nb:
+        sd.generate(nb, fnames[1])
 
 def ipynb2rst(input_fn, output_fn):
+    """Convert a notebook into a rst file, returns all written files."""
     if pathlib.Path(input_fn).stat().st_size == 0:
-        return
+        return []
     with open(input_fn, 'r') as f:
         nb = nbformat.read(f, as_version=4)
     nb = remove_slide_marks(nb)
@@ -526,15 +1039,19 @@ def ipynb2rst(input_fn, output_fn):
     resources = {
         'unique_key':
         'output_' + rm_ext(os.path.basename(output_fn)) + '_' + sig}
-    body, resources = rst_lib.convert_notebook(nb, resources)
+    with profiler.span(f'convert {input_fn}', 'rst'):
+        body, resources = rst_lib.convert_notebook(nb, resources)
     with open(output_fn, 'w') as f:
         f.write(body)
     outputs = resources['outputs']
     base_dir = os.path.dirname(output_fn)
+    fnames = [output_fn]
     for fn in outputs:
         full_fn = os.path.join(base_dir, fn)
         with open(full_fn, 'wb') as f:
             f.write(outputs[fn])
+        fnames.append(full_fn)
+    return fnames
 
 def _job(nb, output_fn, run_cells, timeout, lang):
     # evaluate
@@ -542,7 +1059,8 @@ def _job(nb, output_fn, run_cells, timeout, lang):
         # change to the notebook directory to resolve the relpaths properly
         cwd = os.getcwd()
         os.chdir(os.path.join(cwd, os.path.dirname(output_fn)))
-        notedown.run(nb, timeout)
+        with profiler.span(f'evaluate {output_fn}', 'eval'):
+            execute.run(nb, timeout, output_fn)
         os.chdir(cwd)
     # change stderr output to stdout output
     for cell in nb.cells:
@@ -563,14 +1081,11 @@ def _job(nb, output_fn, run_cells, timeout, lang):
         f.write(nbformat.writes(nb))
 
 def process_latex(fname, script):
-    with open(fname, 'r') as f:
-        lines = f.read().split('\n')
-
-    _combine_citations(lines)
-    _center_graphics(lines)
-
-    with open(fname, 'w') as f:
-        f.write('\n'.join(lines))
+    # stream the lines into a temporary file, a book can be tens of MB
+    tmp_fname = fname + '.tmp'
+    with open(fname, 'r') as fin, open(tmp_fname, 'w') as fout:
+        fout.writelines(_process_latex_lines(fin))
+    os.replace(tmp_fname, fname)
     # Execute custom process_latex script
     if script:
         cmd = "python " + script + " " + fname
@@ -581,22 +1096,22 @@ def process_latex(fname, script):
             logging.error('%s', stderr.decode())
             exit(-1)
 
-def _combine_citations(lines):
-    # convert \sphinxcite{A}\sphinxcite{B} to \sphinxcite{A,B}
-    for i, l in enumerate(lines):
-        if '}\sphinxcite{' in l:
-            lines[i] = l.replace('}\sphinxcite{', ',')
-
-# E.g., tag = 'begin{figure}'
-def _tag_in_line(tag, line):
-    assert '\\' not in set(tag)
-    return any([elem.startswith(tag) for elem in line.split('\\')])
+_graphics_re = re.compile('\\\\sphinxincludegraphics\\{.*\\}')
+_balanced_braces_re = regex.compile('\\{(?>[^{}]|(?R))*\\}')
 
-def _center_graphics(lines):
+def _process_latex_lines(lines):
+    """Combine citations and center graphics line by line."""
     tabulary_cnt = 0
     figure_cnt = 0
     in_doc = False
-    for i, l in enumerate(lines):
+    for l in lines:
+        # only lines with sphinx commands or environments need to be changed
+        if '\\sphinx' not in l and 'begin{' not in l and 'end{' not in l:
+            yield l
+            continue
+        # convert \sphinxcite{A}\sphinxcite{B} to \sphinxcite{A,B}
+        if '}\\sphinxcite{' in l:
+            l = l.replace('}\\sphinxcite{', ',')
         if _tag_in_line('begin{tabulary}', l):
             tabulary_cnt += 1
         elif _tag_in_line('end{tabulary}', l):
@@ -611,14 +1126,22 @@ def _center_graphics(lines):
         # 'tabulary' and 'figure' blocks do include '\centering', so only center
         # '\sphinxincludegraphics{}' by enclosing it with '\begin{center}'
         # '\end{center}'. Logo should not be centered and it is not in_doc.
-        if tabulary_cnt == 0 and figure_cnt == 0 and in_doc:
-            sigs_greedy = re.findall('\\\\sphinxincludegraphics\\{.*\\}', l)
-            if len(sigs_greedy) > 0:
-                longest_balanced_braces = regex.findall(
-                    '\{(?>[^{}]|(?R))*\}', sigs_greedy[0])
-                sig_with_balanced_braces = ('\\sphinxincludegraphics' +
-                                            longest_balanced_braces[0])
-                lines[i] = l.replace(
-                    sig_with_balanced_braces,
-                    ('\\begin{center}' + sig_with_balanced_braces +
-                     '\\end{center}'))
+        sig_greedy = None
+        if (tabulary_cnt == 0 and figure_cnt == 0 and in_doc
+                and '\\sphinxincludegraphics{' in l):
+            sig_greedy = _graphics_re.search(l)
+        if sig_greedy:
+            longest_balanced_braces = _balanced_braces_re.findall(
+                sig_greedy.group())
+            sig_with_balanced_braces = ('\\sphinxincludegraphics' +
+                                        longest_balanced_braces[0])
+            l = l.replace(
+                sig_with_balanced_braces,
+                ('\\begin{center}' + sig_with_balanced_braces +
+                 '\\end{center}'))
+        yield l
+
+# E.g., tag = 'begin{figure}'
+def _tag_in_line(tag, line):
+    # same as any segment of line split by '\\' starting with tag
+    return line.startswith(tag) or ('\\' + tag) in line
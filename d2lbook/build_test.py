@@ -0,0 +1,86 @@
+from d2lbook import build, notebook, resource
+import unittest
+import types
+import tempfile
+import os
+import nbformat
+
+_md = r'''# Test
+
+first para
+
+```{.python .input}
+1+2
+```
+'''
+
+_tex = r'''\sphinxincludegraphics{logo.png}
+\begin{document}
+see \sphinxcite{a}\sphinxcite{b}
+\sphinxincludegraphics{{img/a}.png}
+\begin{figure}[htbp]
+\sphinxincludegraphics{{img/b}.png}
+\end{figure}
+'''
+
+class TestBuild(unittest.TestCase):
+    def test_reuse_outputs(self):
+        nb = notebook.read_markdown(_md)
+        nb.cells[1]['outputs'] = [
+            nbformat.v4.new_output('stream', name='stdout', text='3\n')]
+        nb.cells[1].metadata['d2lbook'] = {'time': 1.5}
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'a.ipynb')
+            with open(fname, 'w') as f:
+                f.write(nbformat.writes(nb))
+            # prose changes
+            new_nb = notebook.read_markdown(_md.replace('first', 'second'))
+            self.assertTrue(build._reuse_outputs(new_nb, fname))
+            saved_nb = notebook.read(fname)
+            self.assertIn('second', saved_nb.cells[0].source)
+            self.assertEqual(saved_nb.cells[1].outputs[0].text, '3\n')
+            self.assertEqual(saved_nb.cells[1].metadata['d2lbook'],
+                             {'time': 1.5})
+            # code changes
+            new_nb = notebook.read_markdown(_md.replace('1+2', '1+3'))
+            self.assertFalse(build._reuse_outputs(new_nb, fname))
+
+    def test_update_ipynb_toc(self):
+        nb = notebook.read_markdown(_md)
+        nb.cells[1].metadata['d2lbook'] = {'time': 1.5}
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'a.ipynb')
+            with open(fname, 'w') as f:
+                f.write(nbformat.writes(nb))
+            build._update_ipynb_toc(fname)
+            self.assertNotIn('d2lbook', notebook.read(fname).cells[1].metadata)
+
+    def test_eval_resources(self):
+        nb = notebook.read_markdown(
+            _md.replace('1+2', '#@eval_resource cpus=0, gpus=1\n1+2'))
+        scheduler = resource.Scheduler(2, 0)
+        config = types.SimpleNamespace(tab=None, build={
+            'eval_cell_timeout': '0', 'eval_notebook_timeout': '0',
+            'eval_max_gpus_per_notebook': '1'})
+        build._process_and_eval_notebook(scheduler, nb, 'a.md', 'a.ipynb',
+                                         True, config)
+        task = scheduler._tasks[0]
+        self.assertEqual((task.num_cpus, task.num_gpus), (1, 0))
+
+    def test_process_latex(self):
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'a.tex')
+            with open(fname, 'w') as f:
+                f.write(_tex)
+            build.process_latex(fname, '')
+            with open(fname) as f:
+                lines = f.read().split('\n')
+        self.assertEqual(lines[0], r'\sphinxincludegraphics{logo.png}')
+        self.assertEqual(lines[2], r'see \sphinxcite{a,b}')
+        self.assertEqual(lines[3], r'\begin{center}\sphinxincludegraphics'
+                         r'{{img/a}.png}\end{center}')
+        self.assertEqual(lines[5], r'\sphinxincludegraphics{{img/b}.png}')
+        self.assertEqual(lines[-1], '')
+
+if __name__ == '__main__':
+    unittest.main()
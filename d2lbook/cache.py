@@ -0,0 +1,71 @@
+"""A persistent build cache keyed by the content hash of inputs"""
+import hashlib
+import json
+import logging
+import os
+
+from d2lbook import utils
+
+def hash_str(*strs):
+    """Return the sha1 hex digest of the concatenation of strs"""
+    sha1 = hashlib.sha1()
+    for s in strs:
+        sha1.update(s.encode())
+        sha1.update(b'\0')
+    return sha1.hexdigest()
+
+def hash_file(fname):
+    """Return the sha1 hex digest of a file's content"""
+    sha1 = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        while True:
+            data = f.read(1048576)
+            if not data:
+                break
+            sha1.update(data)
+    return sha1.hexdigest()
+
+class Cache():
+    """A map from a target filename to the hashes of the inputs that produced it.
+
+    The map is saved as a JSON file, so it survives across builds and doesn't
+    depend on file modification times.
+    """
+    def __init__(self, fname):
+        self._fname = fname
+        self._entries = {}
+        if os.path.exists(fname):
+            try:
+                with open(fname, 'r') as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                logging.warning(f'Ignore the broken cache file {fname}')
+        self.hits = []
+        self.misses = []
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries[key] = value
+
+    def hit(self, key):
+        self.hits.append(key)
+
+    def miss(self, key):
+        self.misses.append(key)
+
+    def save(self):
+        # drop entries whose targets are removed
+        self._entries = {
+            k: v
+            for k, v in self._entries.items() if os.path.exists(k)}
+        utils.mkdir(os.path.dirname(self._fname))
+        tmp_fname = self._fname + '.tmp'
+        with open(tmp_fname, 'w') as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_fname, self._fname)
+
+    def summary(self, name):
+        logging.info(f'{name} cache: {len(self.hits)} hits, '
+                     f'{len(self.misses)} misses')
@@ -0,0 +1,31 @@
+from d2lbook import cache
+import unittest
+import tempfile
+import os
+
+class TestCache(unittest.TestCase):
+    def test_hash(self):
+        self.assertEqual(cache.hash_str('a', 'b'), cache.hash_str('a', 'b'))
+        self.assertNotEqual(cache.hash_str('ab'), cache.hash_str('a', 'b'))
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'a.md')
+            with open(fname, 'w') as f:
+                f.write('# Title')
+            self.assertEqual(len(cache.hash_file(fname)), 40)
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as root:
+            tgt = os.path.join(root, 'a.ipynb')
+            open(tgt, 'w').close()
+            fname = os.path.join(root, 'cache', 'eval.json')
+            c = cache.Cache(fname)
+            c.set(tgt, {'source': '1'})
+            c.set(os.path.join(root, 'removed.ipynb'), {'source': '2'})
+            c.save()
+            c = cache.Cache(fname)
+            self.assertEqual(c.get(tgt), {'source': '1'})
+            # entries of removed targets are dropped
+            self.assertIsNone(c.get(os.path.join(root, 'removed.ipynb')))
+
+if __name__ == '__main__':
+    unittest.main()
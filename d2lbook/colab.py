@@ -1,4 +1,5 @@
 """Integration with Colab notebooks"""
+import functools
 import os
 import re
 import nbformat
@@ -47,32 +48,34 @@ class Colab():
     def generate_notebooks(self, eval_dir, colab_dir, tab):
         if not self._valid:
             return
-        # copy notebook fron eval_dir to colab_dir
-        utils.run_cmd(['rm -rf', colab_dir])
-        utils.run_cmd(['cp -r', eval_dir, colab_dir])
-        notebooks = utils.find_files('**/*.ipynb', colab_dir)
-        for fn in notebooks:
-            nb = notebook.read(fn)
-            if not nb:
-                continue
-            # Use Python3 as the kernel
-            update_notebook_kernel(nb, "python3", "Python 3")
-            # Check if GPU is needed
-            use_gpu = False
-            for cell in nb.cells:
-                if cell.cell_type == 'code':
-                    if self.config['gpu_pattern'] in cell.source:
-                        use_gpu = True
-                        break
-            if use_gpu:
-                nb['metadata'].update({"accelerator": "GPU"})
-                logging.info('Use GPU for '+fn)
-            # Update SVG image URLs
-            if self.config['replace_svg_url']:
-                _update_svg_urls(nb, self.config['replace_svg_url'], fn, colab_dir)
-            insert_additional_installation(nb, self._libs[tab], self.config['libs_header'])
-            with open(fn, 'w') as f:
-                f.write(nbformat.writes(nb))
+        # only the notebooks changed since the last time are updated
+        key = repr((dict(self.config), self._libs.get(tab)))
+        utils.sync_dir(
+            eval_dir, colab_dir, key,
+            functools.partial(self._update_notebook, colab_dir, tab))
+
+    def _update_notebook(self, colab_dir, tab, fn):
+        nb = notebook.read(fn)
+        if not nb:
+            return
+        # Use Python3 as the kernel
+        update_notebook_kernel(nb, "python3", "Python 3")
+        # Check if GPU is needed
+        use_gpu = False
+        for cell in nb.cells:
+            if cell.cell_type == 'code':
+                if self.config['gpu_pattern'] in cell.source:
+                    use_gpu = True
+                    break
+        if use_gpu:
+            nb['metadata'].update({"accelerator": "GPU"})
+            logging.info('Use GPU for '+fn)
+        # Update SVG image URLs
+        if self.config['replace_svg_url']:
+            _update_svg_urls(nb, self.config['replace_svg_url'], fn, colab_dir)
+        insert_additional_installation(nb, self._libs[tab], self.config['libs_header'])
+        with open(fn, 'w') as f:
+            f.write(nbformat.writes(nb))
 
     def add_button(self, html_dir):
         """Add an open colab button in HTML"""
@@ -48,7 +48,10 @@ class Config():
         self.colab_dir = os.path.join(self.tgt_dir, 'colab')
         self.sagemaker_dir = os.path.join(self.tgt_dir, 'sagemaker')
         self.linkcheck_dir = os.path.join(self.tgt_dir, 'linkcheck')
+        # the parsed rst files shared by all sphinx builders
+        self.doctree_dir = os.path.join(self.tgt_dir, 'doctrees')
         self.slides_dir = os.path.join(self.tgt_dir, 'slides')
+        self.cache_dir = os.path.join(self.tgt_dir, 'cache')
 
         self._set_target()
 
@@ -115,6 +118,7 @@ class Config():
         self.colab_dir = self._set_tab_dir(self.colab_dir, tab)
         self.sagemaker_dir = self._set_tab_dir(self.sagemaker_dir, tab)
         self.slides_dir = self._set_tab_dir(self.slides_dir, tab)
+        self.doctree_dir = self._set_tab_dir(self.doctree_dir, tab)
         self._set_target()
 
 
@@ -0,0 +1,140 @@
+"""Run a graph of build stages, independent stages run in parallel"""
+import logging
+import multiprocessing as mp
+from multiprocessing import connection
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+class Graph():
+    """The stages needed by targets and their dependencies.
+
+    get_deps(stage) returns the stages that need to be finished before running
+    the stage.
+    """
+    def __init__(self, targets: Sequence[str],
+                 get_deps: Callable[[str], List[str]]):
+        self.deps: Dict[str, List[str]] = {}
+        self.order: List[str] = []  # topologically sorted
+        for target in targets:
+            self._add(target, get_deps, [])
+
+    def _add(self, stage, get_deps, path):
+        assert stage not in path, f'Found a cycle: {path + [stage]}'
+        if stage in self.deps:
+            return
+        deps = list(get_deps(stage))
+        for dep in deps:
+            self._add(dep, get_deps, path + [stage])
+        self.deps[stage] = deps
+        self.order.append(stage)
+
+    def add_dep(self, stage: str, dep: str):
+        """Let stage run after dep, both are already in the graph."""
+        if dep not in self.deps[stage]:
+            self.deps[stage].append(dep)
+        order, self.order = self.order, []
+        for s in order:
+            self._sort(s, [])
+
+    def depends(self, stage: str, dep: str) -> bool:
+        """Return if stage runs after dep, directly or indirectly."""
+        return any([d == dep or self.depends(d, dep)
+                    for d in self.deps[stage]])
+
+    def _sort(self, stage, path):
+        assert stage not in path, f'Found a cycle: {path + [stage]}'
+        if stage in self.order:
+            return
+        for dep in self.deps[stage]:
+            self._sort(dep, path + [stage])
+        self.order.append(stage)
+
+    def levels(self) -> List[List[str]]:
+        """Group stages into levels, a stage only depends on lower levels."""
+        level = {}
+        for stage in self.order:
+            level[stage] = max([level[d] + 1 for d in self.deps[stage]] + [0])
+        levels = [[] for _ in range(max(level.values(), default=-1) + 1)]
+        for stage in self.order:
+            levels[level[stage]].append(stage)
+        return levels
+
+    def describe(self) -> str:
+        lines = []
+        for i, stages in enumerate(self.levels()):
+            items = []
+            for stage in stages:
+                deps = self.deps[stage]
+                items.append(stage + (f' (after {", ".join(deps)})'
+                                      if deps else ''))
+            lines.append(f'  [{i+1}] ' + ', '.join(items))
+        return '\n'.join(lines)
+
+    def run(self, func: Callable[[str], Any],
+            on_finish: Callable[[str, Any], None],
+            is_done: Optional[Callable[[str], bool]] = None):
+        """Call func(stage) once all its dependencies are finished.
+
+        A stage runs in the current process if it's the only one can run,
+        otherwise each of the stages that can run at the same time runs in a
+        forked process. on_finish(stage, result) is called in the current
+        process with the return value of func. A stage is skipped if
+        is_done(stage) returns True once it can run, e.g. it's already built
+        by another stage. Returns the failed stages.
+        """
+        pending = list(self.order)
+        finished = set()
+        running = {}  # stage -> (process, connection)
+        failed = []
+        while pending or running:
+            ready = [] if failed else [
+                s for s in pending if all([d in finished for d in self.deps[s]])]
+            skipped = [s for s in ready if is_done and is_done(s)]
+            if skipped:
+                for stage in skipped:
+                    pending.remove(stage)
+                    finished.add(stage)
+                continue
+            if len(ready) == 1 and not running:
+                stage = ready[0]
+                pending.remove(stage)
+                on_finish(stage, func(stage))
+                finished.add(stage)
+                continue
+            for stage in ready:
+                pending.remove(stage)
+                conn, child_conn = mp.Pipe(duplex=False)
+                process = mp.Process(target=_run_stage,
+                                     args=(func, stage, child_conn))
+                logging.info(f'Starting stage "{stage}" in a new process')
+                process.start()
+                # so recv raises EOFError if the process exits without sending
+                child_conn.close()
+                running[stage] = (process, conn)
+            if not running:
+                break
+            ready_conns = connection.wait([c for _, c in running.values()])
+            for stage, (process, conn) in list(running.items()):
+                if conn not in ready_conns:
+                    continue
+                try:
+                    status, value = conn.recv()
+                except EOFError:
+                    status, value = 'error', 'the process exited unexpectedly'
+                process.join()
+                del running[stage]
+                if status == 'ok':
+                    on_finish(stage, value)
+                    finished.add(stage)
+                else:
+                    logging.error(f'Stage "{stage}" failed: {value}')
+                    failed.append(stage)
+        return failed
+
+def _run_stage(func, stage, conn):
+    try:
+        conn.send(('ok', func(stage)))
+    except SystemExit as e:
+        conn.send(('error', f'exited with code {e.code}'))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
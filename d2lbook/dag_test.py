@@ -0,0 +1,41 @@
+from d2lbook import dag
+import unittest
+import os
+import time
+
+_deps = {'rst': ['eval'], 'ipynb': ['eval'], 'html': ['rst'],
+         'pdf': ['rst'], 'pkg': ['ipynb']}
+
+def _run(stage):
+    time.sleep(0.5)
+    if stage == 'pdf':
+        exit(-1)
+    return os.getpid()
+
+class TestDAG(unittest.TestCase):
+    def test_levels(self):
+        graph = dag.Graph(['html', 'pkg'], lambda s: _deps.get(s, []))
+        self.assertEqual(graph.levels(),
+                         [['eval'], ['rst', 'ipynb'], ['html', 'pkg']])
+        graph.add_dep('ipynb', 'rst')
+        self.assertEqual(graph.levels(),
+                         [['eval'], ['rst'], ['html', 'ipynb'], ['pkg']])
+
+    def test_run(self):
+        graph = dag.Graph(['html', 'pdf', 'pkg'], lambda s: _deps.get(s, []))
+        pids = {}
+        failed = graph.run(_run, lambda s, pid: pids.update({s: pid}))
+        self.assertEqual(failed, ['pdf'])
+        self.assertEqual(pids['eval'], os.getpid())
+        self.assertNotEqual(pids['rst'], os.getpid())
+        self.assertNotIn('pdf', pids)
+
+    def test_is_done(self):
+        graph = dag.Graph(['html', 'pkg'], lambda s: _deps.get(s, []))
+        self.assertTrue(graph.depends('html', 'eval'))
+        self.assertFalse(graph.depends('html', 'ipynb'))
+        pids = {}
+        failed = graph.run(_run, lambda s, pid: pids.update({s: pid}),
+                           lambda s: s == 'ipynb')
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(pids), ['eval', 'html', 'pkg', 'rst'])
@@ -0,0 +1,168 @@
+"""Show the progress of evaluating notebooks while a build is running"""
+import argparse
+import http.server
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+
+from d2lbook import utils
+from d2lbook.config import Config
+
+__all__ = ['dashboard']
+
+# The status file in the output directory, updated every second during eval
+STATUS_NAME = 'eval_status.json'
+
+# A running notebook is flagged if it runs longer than it times its
+# historical runtime
+SLOW_RATIO = 2
+
+def format_status(status: Dict[str, Any]) -> str:
+    """Return the status returned by resource.Scheduler.status as text."""
+    eta = status.get('eta')
+    eta = 'unknown' if eta is None else utils.format_seconds(eta)
+    running = status['running']
+    lines = [
+        f'{status["num_done"]}/{status["num_tasks"]} notebooks done, '
+        f'{status["num_failed"]} failed, {len(running)} running, '
+        f'{status["num_queued"]} queued, ETA {eta}', 'Devices:']
+    for slot in status['slots']:
+        lines.append(f'  {slot["device"]:<7}  {slot["task"] or "idle"}')
+    if not running:
+        return '\n'.join(lines)
+    lines.append('Running:')
+    lines.append(f'  {"elapsed":>8}  {"predicted":>9}  {"cell":>7}  '
+                 f'{"cell time":>9}  notebook')
+    for task in sorted(running, key=lambda t: -t['elapsed']):
+        predicted = (utils.format_seconds(task['predicted'])
+                     if task['predicted'] else '-')
+        cell, cell_time = '-', '-'
+        if 'cell' in task:
+            cell = f'{task["cell"] + 1}/{task["num_cells"]}'
+            cell_time = utils.format_seconds(task['cell_elapsed'])
+        slow = ''
+        if task['predicted'] and task['elapsed'] > SLOW_RATIO * task[
+                'predicted']:
+            slow = f' (over {SLOW_RATIO}x predicted)'
+        lines.append(f'  {utils.format_seconds(task["elapsed"]):>8}  '
+                     f'{predicted:>9}  {cell:>7}  {cell_time:>9}  '
+                     f'{task["name"]}{slow}')
+    return '\n'.join(lines)
+
+class Dashboard():
+    """Save the latest scheduler status into status_fname.
+
+    If port is not None, also serve the status at http://localhost:port/ as
+    text and at http://localhost:port/status.json as JSON. Port 0 picks a free
+    port. If the port cannot be used, only the status file is saved.
+    """
+    def __init__(self, status_fname: str, port: Optional[int] = None):
+        self._status_fname = status_fname
+        self._status = None
+        self._server = None
+        if port is None:
+            return
+        try:
+            self._server = http.server.ThreadingHTTPServer(
+                ('localhost', port), _handler(self))
+        except OSError as e:
+            logging.warning(f'Failed to serve the evaluation status at port '
+                            f'{port}: {e}')
+            return
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        logging.info('Serving the evaluation status at '
+                     f'http://localhost:{self.port}/')
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server else None
+
+    def update(self, status: Dict[str, Any]):
+        self._status = status
+        utils.write_if_changed(self._status_fname, json.dumps(status))
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def _handler(dashboard):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = dashboard._status
+            if status is None or self.path not in ('/', '/status.json'):
+                self.send_error(404)
+                return
+            if self.path == '/':
+                body, content_type = format_status(status), 'text/plain'
+            else:
+                body, content_type = json.dumps(status), 'application/json'
+            body = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            # don't mix the requests into the build log
+            pass
+
+    return Handler
+
+def dashboard():
+    parser = argparse.ArgumentParser(
+        description='Show the progress of evaluating notebooks in a running '
+        'build')
+    parser.add_argument(
+        '--url', default=None,
+        help='The URL served by a build with eval_dashboard_port set, such as '
+        'http://localhost:8000. The default is to read the status file in '
+        'the output directory.')
+    parser.add_argument('--interval', type=float, default=2,
+                        help='The seconds between two refreshes')
+    parser.add_argument('--once', action='store_true',
+                        help='Print the status once and exit')
+    args = parser.parse_args(sys.argv[2:])
+    if args.url:
+        url = args.url.rstrip('/') + '/status.json'
+
+        def _load():
+            with urllib.request.urlopen(url, timeout=10) as f:
+                return json.load(f)
+    else:
+        fname = os.path.join(Config().tgt_dir, STATUS_NAME)
+
+        def _load():
+            with open(fname, 'r') as f:
+                return json.load(f)
+
+    try:
+        while True:
+            try:
+                status = _load()
+            except (OSError, ValueError) as e:
+                logging.error(f'Failed to read the status: {e}')
+                exit(-1)
+            text = format_status(status)
+            finished = status['num_done'] == status['num_tasks']
+            if args.once or finished:
+                print(text)
+                return
+            age = time.time() - status['time']
+            if age > 10:
+                text += (f'\nNot updated in the last {age:.0f} sec, the build '
+                         'may have stopped')
+            # clear the screen and redraw
+            sys.stdout.write('\x1b[H\x1b[2J' + text + '\n')
+            sys.stdout.flush()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,48 @@
+from d2lbook import dashboard
+import unittest
+import json
+import os
+import tempfile
+import urllib.request
+
+_status = {
+    'time': 0, 'num_tasks': 3, 'num_done': 1, 'num_failed': 0,
+    'num_queued': 1, 'eta': 70, 'slots': [
+        {'device': 'CPU 0', 'task': 'a.ipynb'},
+        {'device': 'CPU 1', 'task': None}], 'running': [{
+            'name': 'a.ipynb', 'description': 'Evaluating a.md', 'cpus': [0],
+            'gpus': [], 'elapsed': 30, 'predicted': 10, 'peak_memory': 0,
+            'cell': 4, 'num_cells': 10, 'cell_elapsed': 25}]}
+
+class TestDashboard(unittest.TestCase):
+    def test_format_status(self):
+        lines = dashboard.format_status(_status).split('\n')
+        self.assertEqual(
+            lines[0],
+            '1/3 notebooks done, 0 failed, 1 running, 1 queued, ETA 00:01:10')
+        self.assertEqual(lines[3], '  CPU 1    idle')
+        self.assertEqual(
+            lines[6], '  00:00:30   00:00:10     5/10   00:00:25  a.ipynb '
+            '(over 2x predicted)')
+
+    def test_server(self):
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, dashboard.STATUS_NAME)
+            board = dashboard.Dashboard(fname, port=0)
+            board.update(_status)
+            try:
+                url = f'http://localhost:{board.port}'
+                with urllib.request.urlopen(url + '/status.json') as f:
+                    self.assertEqual(json.load(f), _status)
+                with urllib.request.urlopen(url) as f:
+                    self.assertEqual(f.read().decode(),
+                                     dashboard.format_status(_status))
+                # the port is used
+                with self.assertLogs() as logs:
+                    other = dashboard.Dashboard(fname, port=board.port)
+                self.assertIsNone(other.port)
+                self.assertIn('Failed to serve', logs.output[0])
+            finally:
+                board.close()
+            with open(fname) as f:
+                self.assertEqual(json.load(f), _status)
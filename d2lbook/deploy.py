@@ -9,6 +9,7 @@ from d2lbook.config import Config
 from d2lbook import colab
 from d2lbook import sagemaker
 from d2lbook import slides
+from d2lbook import profiler
 import glob
 
 __all__  = ['deploy']
@@ -19,6 +20,11 @@ def deploy():
     parser = argparse.ArgumentParser(description='Deploy documents')
     parser.add_argument('commands', nargs='+', choices=commands)
     parser.add_argument('--s3', help='s3 bucket')
+    parser.add_argument(
+        '--profile', nargs='?', const='', default=None, metavar='FILE',
+        help='Record the time of each upload into FILE in the Chrome trace '
+        'format. The default FILE is deploy_trace.json in the output '
+        'directory.')
     args = parser.parse_args(sys.argv[2:])
     config = Config()
     if args.s3:
@@ -29,13 +35,27 @@ def deploy():
         deployer = GithubDeployer(config)
     else:
         deployer = Deployer(config)
-    for cmd in args.commands:
-        getattr(deployer, cmd)()
+    if args.profile is not None:
+        profiler.enable()
+    try:
+        for cmd in args.commands:
+            with profiler.span(f'deploy {cmd}', 'deploy'):
+                getattr(deployer, cmd)()
+        with profiler.span('deploy upload', 'deploy'):
+            deployer.upload()
+    finally:
+        if args.profile is not None:
+            profiler.save(args.profile or os.path.join(
+                config.tgt_dir, 'deploy_trace.json'))
 
 class Deployer(object):
     def __init__(self, config):
         self.config = config
 
+    def upload(self):
+        """Upload the files collected by the commands, if any."""
+        pass
+
     def colab(self):
         _colab = colab.Colab(self.config)
         if not _colab.valid():
@@ -101,7 +121,7 @@ class GithubDeployer(Deployer):
     def pkg(self):
         shutil.copy(self.config.pkg_fname, self.git_dir)
 
-    def __del__(self):
+    def upload(self):
         bash_fname = os.path.join(os.path.dirname(__file__), 'upload_github.sh')
         run_cmd(['bash', bash_fname, self.git_dir, self.config.deploy['github_repo'], self.config.project['release']])
 
@@ -0,0 +1,191 @@
+"""Evaluate notebooks with Jupyter kernels"""
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict
+
+import nbclient
+from jupyter_client import AsyncKernelClient, KernelManager
+from jupyter_core.utils import ensure_async, run_sync
+from nbformat import notebooknode
+from traitlets.config import Config
+
+from d2lbook import profiler, resource
+
+# The environment variable to pass the connection file of a warm kernel to
+# the process evaluating a notebook.
+KERNEL_ENV = 'D2LBOOK_KERNEL_CONNECTION_FILE'
+
+def _kernel_config(ipc_dir, name='kernel'):
+    config = Config()
+    if os.name == 'posix':
+        # Connect to the kernel through unix domain sockets in a private
+        # directory instead of TCP ports, so kernels started at the same time
+        # never race for a port, see
+        # https://github.com/jupyter/nbconvert/issues/1066
+        config.KernelManager.transport = 'ipc'
+        config.KernelManager.ip = os.path.join(ipc_dir, name)
+    return config
+
+def run(nb: notebooknode.NotebookNode, timeout: int, name: str = ''):
+    """Execute all code cells in nb under the current working directory.
+
+    If a warm kernel is assigned by KernelPool, then run in it, otherwise start
+    a new kernel. timeout is the maximal seconds to run a cell, which can be
+    overwritten by a mark in the cell, see resource.get_cell_timeout. name is
+    the notebook name used in the profiling spans.
+
+    The wall time in seconds, the peak memory of the kernel in GB so far, and
+    the output size in bytes of each executed cell are saved in
+    cell.metadata['d2lbook'].
+    """
+    connection_file = os.environ.get(KERNEL_ENV)
+    if connection_file:
+        _run_in_kernel(nb, timeout, connection_file, name)
+        return
+    ipc_dir = tempfile.mkdtemp(prefix='d2lbook_')
+    try:
+        client = nbclient.NotebookClient(
+            nb, timeout=timeout, timeout_func=_timeout_func(timeout),
+            config=_kernel_config(ipc_dir), resources={'metadata': {
+                'path': os.getcwd()}})
+        starts = {}
+
+        def _on_cell_execute(cell, cell_index):
+            starts[cell_index] = time.time()
+            resource.report_progress(cell_index, len(nb.cells))
+
+        client.on_cell_execute = _on_cell_execute
+        client.on_cell_executed = lambda cell, cell_index, execute_reply: (
+            _record_cell(name, cell, cell_index, starts[cell_index],
+                         getattr(client.km.provisioner, 'pid', None)))
+        client.execute()
+    finally:
+        shutil.rmtree(ipc_dir, ignore_errors=True)
+
+def _timeout_func(timeout):
+    def _get_timeout(cell):
+        cell_timeout = resource.get_cell_timeout(cell)
+        return timeout if cell_timeout is None else cell_timeout
+
+    return _get_timeout
+
+def _record_cell(name, cell, index, start, kernel_pid):
+    seconds = time.time() - start
+    profiler.add_span(f'cell {index} of {name}', start, seconds, 'kernel')
+    peak_memory = resource.get_peak_memory(kernel_pid) if kernel_pid else None
+    cell.metadata['d2lbook'] = {
+        'time': round(seconds, 3),
+        'peak_memory': None if peak_memory is None else round(peak_memory, 3),
+        'output_size': len(json.dumps(cell.get('outputs', [])))}
+
+def _run_in_kernel(nb, timeout, connection_file, name):
+    kc = AsyncKernelClient()
+    kc.load_connection_file(connection_file)
+    kc.start_channels()
+    try:
+        run_sync(_async_run_in_kernel)(nb, timeout, kc, name)
+    finally:
+        kc.stop_channels()
+
+async def _async_run_in_kernel(nb, timeout, kc, name):
+    client = nbclient.NotebookClient(nb, timeout=timeout,
+                                     timeout_func=_timeout_func(timeout))
+    client.reset_execution_trackers()
+    client.kc = kc
+    # the kernel replies after the preload code is finished. also wait until
+    # the iopub channel is connected, otherwise the first outputs may be lost
+    await ensure_async(kc.wait_for_ready(timeout=timeout or None))
+    info_msg = await client.async_wait_for_reply(await ensure_async(
+        kc.kernel_info()))
+    nb.metadata['language_info'] = info_msg['content']['language_info']
+    # the kernel was started before the working directory and the devices are
+    # known
+    setup = '\n'.join([
+        'import os as _d2lbook_os', f'_d2lbook_os.chdir({os.getcwd()!r})',
+        "_d2lbook_os.environ['CUDA_VISIBLE_DEVICES'] = "
+        f"{os.environ.get('CUDA_VISIBLE_DEVICES', '')!r}",
+        'del _d2lbook_os'])
+    reply = await client.async_wait_for_reply(
+        kc.execute(setup, silent=True, store_history=False,
+                   user_expressions={'pid': "__import__('os').getpid()"}))
+    if reply['content']['status'] != 'ok':
+        raise RuntimeError(f'Failed to setup the kernel: {reply["content"]}')
+    pid = int(reply['content']['user_expressions']['pid']['data']['text/plain'])
+    for index, cell in enumerate(nb.cells):
+        tik = time.time()
+        if cell.cell_type == 'code':
+            resource.report_progress(index, len(nb.cells))
+        await client.async_execute_cell(
+            cell, index, execution_count=client.code_cells_executed + 1)
+        if cell.cell_type == 'code' and cell.source.strip():
+            _record_cell(name, cell, index, tik, pid)
+    client.set_widgets_metadata()
+
+class KernelPool():
+    """Kernels started in advance for each tab.
+
+    Heavy libraries specified by preloads, a dict from a tab to the code, are
+    imported when a kernel is started. A kernel only runs a single notebook,
+    after that it's shut down and a new one is started, whose preload code runs
+    while other notebooks are evaluated.
+    """
+    def __init__(self, size: int, preloads: Dict[str, str]):
+        self._size = size
+        self._preloads = preloads
+        self._ipc_dir = tempfile.mkdtemp(prefix='d2lbook_')
+        self._ids = itertools.count()
+        self._idle = {}  # tab -> a list of (manager, client)
+        self._busy = {}  # connection_file -> (manager, client, tab)
+
+    def _start_kernel(self, tab):
+        name = f'kernel{next(self._ids)}'
+        km = KernelManager(
+            config=_kernel_config(self._ipc_dir, name),
+            connection_file=os.path.join(self._ipc_dir, name + '.json'))
+        km.start_kernel(cwd=os.getcwd())
+        kc = km.client()
+        kc.start_channels(iopub=False, stdin=False, hb=False, control=False)
+        preload = self._preloads.get(tab, '')
+        if preload:
+            # don't wait for the reply
+            kc.execute(preload, silent=True, store_history=False)
+        self._idle.setdefault(tab, []).append((km, kc))
+
+    def start(self, tab: str):
+        """Fill up the warm kernels for tab."""
+        for _ in range(self._size - len(self._idle.get(tab, []))):
+            self._start_kernel(tab)
+        logging.info(f'Started {self._size} warm kernels for tab "{tab}"')
+
+    def acquire(self, tab: str):
+        """Return the environment variables for a process to use a kernel."""
+        if not self._idle.get(tab):
+            self._start_kernel(tab)
+        km, kc = self._idle[tab].pop(0)
+        self._busy[km.connection_file] = (km, kc, tab)
+        return {KERNEL_ENV: km.connection_file}
+
+    def get_pid(self, env: Dict[str, str]):
+        """Return the process id of the kernel used by env."""
+        return self._busy[env[KERNEL_ENV]][0].provisioner.pid
+
+    def release(self, env: Dict[str, str]):
+        """Shutdown a used kernel and start a new one in the background."""
+        km, kc, tab = self._busy.pop(env[KERNEL_ENV])
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+        self._start_kernel(tab)
+
+    def shutdown(self):
+        for km, kc, _ in list(self._busy.values()) + [
+                (km, kc, tab) for tab, kernels in self._idle.items()
+                for km, kc in kernels]:
+            kc.stop_channels()
+            km.shutdown_kernel(now=True)
+        self._idle, self._busy = {}, {}
+        shutil.rmtree(self._ipc_dir, ignore_errors=True)
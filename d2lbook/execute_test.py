@@ -0,0 +1,47 @@
+from d2lbook import execute
+import unittest
+import os
+import nbclient
+from nbformat import v4
+
+class TestExecute(unittest.TestCase):
+    def _notebook(self):
+        return v4.new_notebook(cells=[
+            v4.new_code_cell('import os\nprint(os.getcwd())'),
+            v4.new_code_cell("print(globals().get('preloaded', 0) + 1)")])
+
+    def test_run(self):
+        nb = self._notebook()
+        execute.run(nb, 60)
+        self.assertEqual(nb.cells[0].outputs[0].text.strip(), os.getcwd())
+        self.assertEqual(nb.cells[1].outputs[0].text.strip(), '1')
+        stats = nb.cells[1].metadata['d2lbook']
+        self.assertGreater(stats['time'], 0)
+        self.assertGreater(stats['peak_memory'], 0)
+        self.assertGreater(stats['output_size'], 0)
+
+    def test_cell_timeout(self):
+        nb = v4.new_notebook(cells=[
+            v4.new_code_cell('#@eval_timeout cell=10\nimport time\n'
+                             'time.sleep(2)'),
+            v4.new_code_cell('#@eval_timeout cell=1\ntime.sleep(10)')])
+        with self.assertRaises(nbclient.exceptions.CellTimeoutError):
+            execute.run(nb, 1)
+        self.assertIn('d2lbook', nb.cells[0].metadata)
+
+    def test_kernel_pool(self):
+        pool = execute.KernelPool(1, {'': 'preloaded = 41'})
+        pool.start('')
+        try:
+            env = pool.acquire('')
+            os.environ.update(env)
+            nb = self._notebook()
+            execute.run(nb, 60)
+            self.assertEqual(nb.cells[0].outputs[0].text.strip(), os.getcwd())
+            self.assertEqual(nb.cells[1].outputs[0].text.strip(), '42')
+            self.assertEqual(nb.cells[1].execution_count, 2)
+            self.assertGreater(nb.cells[1].metadata['d2lbook']['peak_memory'], 0)
+            pool.release(env)
+        finally:
+            os.environ.pop(execute.KERNEL_ENV, None)
+            pool.shutdown()
@@ -0,0 +1,128 @@
+"""Compile the LaTeX files generated by sphinx into PDF incrementally"""
+import json
+import logging
+import os
+import re
+import subprocess
+import time
+from typing import Dict, List
+
+from d2lbook import cache as cache_lib
+from d2lbook import profiler, utils
+
+# The files written by LaTeX and latexmk, they don't change the document. The
+# compiled PDF is excluded by its name, other .pdf files such as figures are
+# inputs.
+_OUTPUT_EXTS = ('.aux', '.toc', '.out', '.log', '.idx', '.ind', '.ilg', '.xdv',
+                '.lof', '.lot', '.fls', '.fdb_latexmk', '.synctex.gz')
+
+def split_chapters(tex: str) -> Dict[str, str]:
+    """Split tex into chapters keyed by their titles.
+
+    The text before the first chapter is keyed by an empty string.
+    """
+    chapters, title, lines = {}, '', []
+    for line in tex.split('\n'):
+        m = re.match(r'\\chapter\*?\{(.*)\}', line)
+        if m:
+            chapters[title] = '\n'.join(lines)
+            title, lines = m.group(1), []
+            # keep chapters with the same title apart
+            while title in chapters:
+                title += "'"
+        lines.append(line)
+    chapters[title] = '\n'.join(lines)
+    return chapters
+
+def _input_files(pdf_dir, outputs):
+    outputs = [os.path.normpath(fn) for fn in outputs]
+    fnames = []
+    for root, _, files in os.walk(pdf_dir):
+        for fn in files:
+            fname = os.path.join(root, fn)
+            if os.path.normpath(fname) not in outputs and not fn.endswith(_OUTPUT_EXTS):
+                fnames.append(fname)
+    return sorted(fnames)
+
+def _hash_inputs(pdf_dir, outputs):
+    fnames = _input_files(pdf_dir, outputs)
+    return cache_lib.hash_str(*[
+        os.path.relpath(fn, pdf_dir) + ':' + cache_lib.hash_file(fn)
+        for fn in fnames])
+
+def compile_pdf(tex_fname: str) -> bool:
+    """Run the sphinx generated Makefile to compile tex_fname into PDF.
+
+    The compilation is skipped if the PDF exists and none of the files in the
+    directory, such as the .tex file and images, changed since the last
+    successful compilation. Otherwise the chapters changed are logged and the
+    time of each LaTeX pass is reported. The auxiliary files of the last
+    compilation are kept, so latexmk stops the passes as soon as they are
+    stable. Returns if the PDF is compiled.
+    """
+    pdf_dir = os.path.dirname(tex_fname) or '.'
+    pdf_fname = os.path.splitext(tex_fname)[0] + '.pdf'
+    stamp_fname = os.path.splitext(tex_fname)[0] + '.d2lbook.json'
+    stamp = {}
+    if os.path.exists(stamp_fname):
+        with open(stamp_fname) as f:
+            stamp = json.load(f)
+    inputs = _hash_inputs(pdf_dir, (stamp_fname, pdf_fname))
+    if stamp.get('inputs') == inputs and os.path.exists(pdf_fname):
+        logging.info(f'{pdf_fname} is up to date')
+        return False
+    with open(tex_fname) as f:
+        chapters = {
+            title: cache_lib.hash_str(body)
+            for title, body in split_chapters(f.read()).items()}
+    if stamp.get('chapters'):
+        _log_changed_chapters(stamp['chapters'], chapters)
+    passes = _run_make(pdf_dir)
+    logging.info(f'Compiled {pdf_fname} with {len(passes)} passes: ' +
+                 ', '.join([f'{rule} {t:.1f} sec' for rule, t in passes]))
+    utils.write_if_changed(
+        stamp_fname, json.dumps({
+            'inputs': inputs, 'chapters': chapters}, indent=2))
+    return True
+
+def _log_changed_chapters(old, new):
+    changed = [t for t in new if t in old and old[t] != new[t]]
+    added = [t for t in new if t not in old]
+    removed = [t for t in old if t not in new]
+    for name, titles in [('Changed', changed), ('Added', added),
+                         ('Removed', removed)]:
+        if titles:
+            titles = [t if t else '(front matter)' for t in titles]
+            logging.info(f'{name} {len(titles)} chapters: ' + ', '.join(titles))
+    if not (changed or added or removed):
+        logging.info('No chapter changed, only other files such as images')
+
+def _run_make(pdf_dir) -> List:
+    """Run make in pdf_dir, returns the (rule, seconds) of each latexmk run."""
+    passes = []
+    output = []
+    process = subprocess.Popen(['make'], cwd=pdf_dir, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True,
+                               errors='replace')
+    tik = time.time()
+    for line in process.stdout:
+        output.append(line)
+        m = re.match(r"Run number \d+ of rule '([^']+)'", line)
+        if m:
+            tok = time.time()
+            if passes:
+                _end_pass(passes, tik, tok)
+            passes.append([m.group(1), 0])
+            tik = tok
+    process.wait()
+    if passes:
+        _end_pass(passes, tik, time.time())
+    if process.returncode != 0:
+        logging.error('Failed to compile the PDF:\n%s', ''.join(output[-50:]))
+        exit(-1)
+    return [tuple(p) for p in passes]
+
+def _end_pass(passes, tik, tok):
+    passes[-1][1] = tok - tik
+    profiler.add_span(f'latex pass {len(passes)} {passes[-1][0]}', tik,
+                      tok - tik, 'latex')
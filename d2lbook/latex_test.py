@@ -0,0 +1,54 @@
+from d2lbook import latex
+import unittest
+import os
+import tempfile
+
+_tex = r'''\documentclass{book}
+\begin{document}
+\chapter{Intro}
+abc
+\chapter{Intro}
+def
+\end{document}'''
+
+# Pretend to be latexmk running xelatex twice
+_makefile = '''all:
+\t@echo "Run number 1 of rule 'xelatex'"
+\t@echo "Run number 2 of rule 'xelatex'"
+\t@touch book.pdf book.aux
+'''
+
+class TestLatex(unittest.TestCase):
+    def test_split_chapters(self):
+        chapters = latex.split_chapters(_tex)
+        self.assertEqual(list(chapters.keys()), ['', 'Intro', "Intro'"])
+        self.assertEqual(chapters['Intro'], '\\chapter{Intro}\nabc')
+        self.assertEqual('\n'.join(chapters.values()), _tex)
+
+    def test_compile_pdf(self):
+        with tempfile.TemporaryDirectory() as pdf_dir:
+            tex_fname = os.path.join(pdf_dir, 'book.tex')
+            for fname, content in [(tex_fname, _tex),
+                                   (os.path.join(pdf_dir, 'Makefile'), _makefile)]:
+                with open(fname, 'w') as f:
+                    f.write(content)
+            with self.assertLogs() as logs:
+                self.assertTrue(latex.compile_pdf(tex_fname))
+            self.assertIn('with 2 passes: xelatex', logs.output[-1])
+            self.assertFalse(latex.compile_pdf(tex_fname))
+            with open(tex_fname, 'w') as f:
+                f.write(_tex.replace('def', 'xyz'))
+            with self.assertLogs() as logs:
+                self.assertTrue(latex.compile_pdf(tex_fname))
+            self.assertIn("Changed 1 chapters: Intro'", logs.output[0])
+            self.assertFalse(latex.compile_pdf(tex_fname))
+            # a figure in PDF is an input, the compiled book.pdf is not
+            with open(os.path.join(pdf_dir, 'fig.pdf'), 'w') as f:
+                f.write('1')
+            self.assertTrue(latex.compile_pdf(tex_fname))
+            with open(os.path.join(pdf_dir, 'fig.pdf'), 'w') as f:
+                f.write('2')
+            with self.assertLogs() as logs:
+                self.assertTrue(latex.compile_pdf(tex_fname))
+            self.assertIn('only other files such as images', logs.output[0])
+            self.assertFalse(latex.compile_pdf(tex_fname))
@@ -77,8 +77,7 @@ def _save_block(source: str, save_mark: str):
 def _save_code(input_fn, save_mark='@save', tab=None,
                default_tab=None):
     """get the code blocks (import, class, def) that will be saved"""
-    with open(input_fn, 'r', encoding='UTF-8') as f:
-        nb = notebook.read_markdown(f.read())
+    nb = notebook.read_markdown_file(input_fn)
     if tab:
         nb = notebook.get_tab_notebook(nb, tab, default_tab)
         if not nb:
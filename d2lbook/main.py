@@ -6,6 +6,8 @@ from d2lbook.clear import clear
 from d2lbook.activate import activate
 from d2lbook.translate import translate
 from d2lbook.slides import slides
+from d2lbook.metrics import metrics
+from d2lbook.dashboard import dashboard
 import logging
 
 logging.basicConfig(format='[d2lbook:%(filename)s:L%(lineno)d] %(levelname)-6s %(message)s')
@@ -14,7 +16,8 @@ logging.getLogger().setLevel(logging.INFO)
 
 def main():
     commands = {'build': build, 'deploy':deploy, 'clear':clear,
-                'activate':activate, 'translate':translate, 'slides':slides}
+                'activate':activate, 'translate':translate, 'slides':slides,
+                'metrics':metrics, 'dashboard':dashboard}
     parser = argparse.ArgumentParser(description='''
 D2L Book: Publish a book based on Jupyter notebooks.
 
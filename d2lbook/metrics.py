@@ -0,0 +1,204 @@
+"""Save the metrics of each build into a SQLite database and query them"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from d2lbook.config import Config
+
+__all__ = ['metrics']
+
+# The database file and the id of the current run. It's passed by the
+# environment, so the stages running in other processes record into the same
+# run.
+METRICS_ENV = 'D2LBOOK_METRICS'
+
+DB_NAME = 'metrics.sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, start REAL, seconds REAL, commands TEXT, tab TEXT,
+    host TEXT, status TEXT);
+CREATE TABLE IF NOT EXISTS stages (run INTEGER, name TEXT, seconds REAL);
+CREATE TABLE IF NOT EXISTS notebooks (
+    run INTEGER, name TEXT, seconds REAL, peak_memory REAL, num_cpus INTEGER,
+    num_gpus INTEGER, status TEXT);
+CREATE TABLE IF NOT EXISTS counters (run INTEGER, name TEXT, value REAL);
+'''
+
+@contextlib.contextmanager
+def _connect(db_fname):
+    # several processes may write at the same time, wait for the lock
+    conn = sqlite3.connect(db_fname, timeout=60)
+    try:
+        conn.executescript(_SCHEMA)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+def start_run(db_fname: str, commands: Sequence[str], tab: Optional[str]):
+    """Start recording the metrics of a build into db_fname.
+
+    Returns the run id, or None if the database cannot be written, then
+    nothing is recorded for this run.
+    """
+    try:
+        os.makedirs(os.path.dirname(db_fname) or '.', exist_ok=True)
+        with _connect(db_fname) as conn:
+            cursor = conn.execute(
+                'INSERT INTO runs (start, commands, tab, host, status) '
+                'VALUES (?, ?, ?, ?, ?)', (time.time(), ' '.join(commands),
+                                           tab or '', socket.gethostname(),
+                                           'running'))
+            run = cursor.lastrowid
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f'Failed to record metrics into {db_fname}: {e}')
+        return None
+    os.environ[METRICS_ENV] = json.dumps([db_fname, run])
+    return run
+
+def finish_run(status: str):
+    """Stop recording, status is either ok or failed."""
+    current = os.environ.pop(METRICS_ENV, None)
+    if not current:
+        return
+    db_fname, run = json.loads(current)
+    try:
+        with _connect(db_fname) as conn:
+            conn.execute(
+                'UPDATE runs SET seconds = ? - start, status = ? WHERE id = ?',
+                (time.time(), status, run))
+    except sqlite3.Error as e:
+        logging.warning(f'Failed to record metrics into {db_fname}: {e}')
+
+def _insert(table, rows):
+    current = os.environ.get(METRICS_ENV)
+    if not current or not rows:
+        return
+    db_fname, run = json.loads(current)
+    values = ', '.join(['?'] * (len(rows[0]) + 1))
+    try:
+        with _connect(db_fname) as conn:
+            conn.executemany(f'INSERT INTO {table} VALUES ({values})',
+                             [(run,) + tuple(row) for row in rows])
+    except sqlite3.Error as e:
+        # metrics should never fail a build
+        logging.warning(f'Failed to record metrics into {db_fname}: {e}')
+
+def record_stage(name: str, seconds: float):
+    _insert('stages', [(name, seconds)])
+
+def record_notebooks(stats: List[Dict[str, Any]]):
+    """Record the stats returned by resource.Scheduler.task_stats."""
+    _insert('notebooks', [(s['name'], s['seconds'], s['peak_memory'],
+                           s['num_cpus'], s['num_gpus'], s['status'])
+                          for s in stats])
+
+def record_counters(counters: Dict[str, float]):
+    _insert('counters', list(counters.items()))
+
+def get_size(path: str):
+    """Return the total bytes of a file or all files in a directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            fname = os.path.join(root, fn)
+            if not os.path.islink(fname):
+                size += os.path.getsize(fname)
+    return size
+
+def find_slower(conn, table: str, since: float, ratio: float,
+                min_seconds: float):
+    """Return the (name, before, after) seconds of the items in table, which
+    is either stages or notebooks, that are at least ratio times slower in the
+    latest run than in the last run before since."""
+    rows = conn.execute(
+        f'SELECT t.name, r.start, t.seconds FROM {table} t '
+        'JOIN runs r ON t.run = r.id ORDER BY r.start').fetchall()
+    before, after = {}, {}
+    for name, start, seconds in rows:
+        if start < since:
+            before[name] = seconds
+        else:
+            after[name] = seconds
+    slower = [(name, before[name], seconds)
+              for name, seconds in after.items()
+              if name in before and seconds >= min_seconds and
+              seconds >= ratio * max(before[name], 1e-3)]
+    return sorted(slower, key=lambda x: -x[2] / max(x[1], 1e-3))
+
+def _parse_since(since: str):
+    """Convert 7d, 12h or 30m into the unix time of that long ago."""
+    m = re.fullmatch(r'(\d+(?:\.\d+)?)([dhm])', since.strip())
+    if not m:
+        raise ValueError(f'Invalid duration {since}, e.g. 7d, 12h or 30m')
+    unit = {'d': 86400, 'h': 3600, 'm': 60}[m.group(2)]
+    return time.time() - float(m.group(1)) * unit
+
+def _format_time(t):
+    return datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M')
+
+def metrics():
+    parser = argparse.ArgumentParser(
+        description='Query the metrics recorded by previous builds')
+    parser.add_argument('command', choices=['runs', 'slower'],
+                        help='runs lists the recent builds, slower lists the '
+                        'notebooks and stages got slower')
+    parser.add_argument('-n', type=int, default=20,
+                        help='The number of runs to list')
+    parser.add_argument(
+        '--since', default=None,
+        help='For slower, compare the latest runs with the last run before '
+        'this long ago, such as 7d, 12h or 30m. The default is to compare '
+        'with the run before the latest one.')
+    parser.add_argument('--run', type=int, default=None,
+                        help='For slower, compare with the runs up to this id')
+    parser.add_argument('--ratio', type=float, default=2,
+                        help='For slower, the minimal slow down to report')
+    parser.add_argument('--min-seconds', type=float, default=1,
+                        help='For slower, ignore items faster than it')
+    args = parser.parse_args(sys.argv[2:])
+    config = Config()
+    db_fname = os.path.join(config.tgt_dir, DB_NAME)
+    if not os.path.exists(db_fname):
+        logging.error(f'{db_fname} does not exist, run d2lbook build first')
+        exit(-1)
+    with _connect(db_fname) as conn:
+        if args.command == 'runs':
+            print(f'{"id":>5}  {"start":<16}  {"seconds":>8}  {"status":<7}  '
+                  'commands')
+            for run, start, seconds, commands, tab, status in reversed(
+                    conn.execute(
+                        'SELECT id, start, seconds, commands, tab, status '
+                        'FROM runs ORDER BY id DESC LIMIT ?',
+                        (args.n,)).fetchall()):
+                tab = f' --tab {tab}' if tab else ''
+                print(f'{run:>5}  {_format_time(start):<16}  '
+                      f'{seconds or 0:>8.1f}  {status:<7}  {commands}{tab}')
+            return
+        if args.run is not None:
+            since = conn.execute('SELECT MIN(start) FROM runs WHERE id > ?',
+                                 (args.run,)).fetchone()[0] or time.time()
+        elif args.since:
+            since = _parse_since(args.since)
+        else:
+            since = conn.execute('SELECT MAX(start) FROM runs').fetchone()[0]
+        for table in ('notebooks', 'stages'):
+            slower = find_slower(conn, table, since, args.ratio,
+                                 args.min_seconds)
+            print(f'{len(slower)} {table} got {args.ratio}x slower since '
+                  f'{_format_time(since)}:')
+            for name, before, after in slower:
+                print(f'  {before:>8.1f} -> {after:>8.1f} sec '
+                      f'({after / max(before, 1e-3):.1f}x)  {name}')
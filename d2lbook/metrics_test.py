@@ -0,0 +1,51 @@
+from d2lbook import metrics
+import unittest
+import os
+import tempfile
+import time
+
+class TestMetrics(unittest.TestCase):
+    def test_find_slower(self):
+        with tempfile.TemporaryDirectory() as root:
+            db_fname = os.path.join(root, metrics.DB_NAME)
+            for seconds in [(2, 10), (5, 11)]:
+                metrics.start_run(db_fname, ['eval'], None)
+                metrics.record_stage('eval', sum(seconds))
+                metrics.record_notebooks([
+                    dict(name=name, seconds=s, peak_memory=0.1, num_cpus=1,
+                         num_gpus=0, status='ok')
+                    for name, s in zip(['a.ipynb', 'b.ipynb'], seconds)])
+                metrics.record_counters({'eval_cache_hits': 3})
+                metrics.finish_run('ok')
+                since = time.time()
+            with metrics._connect(db_fname) as conn:
+                runs = conn.execute('SELECT id, status FROM runs').fetchall()
+                self.assertEqual(runs, [(1, 'ok'), (2, 'ok')])
+                latest = conn.execute('SELECT MAX(start) FROM runs').fetchone()[0]
+                self.assertEqual(
+                    metrics.find_slower(conn, 'notebooks', latest, 2, 1),
+                    [('a.ipynb', 2, 5)])
+                self.assertEqual(
+                    metrics.find_slower(conn, 'stages', latest, 1.2, 1),
+                    [('eval', 12, 16)])
+                self.assertEqual(
+                    metrics.find_slower(conn, 'notebooks', since, 2, 1), [])
+        self.assertNotIn(metrics.METRICS_ENV, os.environ)
+
+    def test_unwritable_db(self):
+        with tempfile.TemporaryDirectory() as root:
+            # a directory can't be opened as a database
+            db_fname = os.path.join(root, metrics.DB_NAME)
+            os.mkdir(db_fname)
+            with self.assertLogs(level='WARNING'):
+                self.assertIsNone(metrics.start_run(db_fname, ['eval'], None))
+            self.assertNotIn(metrics.METRICS_ENV, os.environ)
+            metrics.record_stage('eval', 1)
+            metrics.finish_run('ok')
+            os.rmdir(db_fname)
+            metrics.start_run(db_fname, ['eval'], None)
+            os.remove(db_fname)
+            os.mkdir(db_fname)
+            with self.assertLogs(level='WARNING'):
+                metrics.finish_run('failed')
+            self.assertNotIn(metrics.METRICS_ENV, os.environ)
@@ -4,13 +4,22 @@ from typing import Union, List, Optional
 
 import os
 import copy
+import json
+import logging
+import time
 import notedown
+import notedown.notedown
 import nbformat
 import nbconvert
 from nbformat import notebooknode
+from nbformat.corpus.words import generate_corpus_id as random_cell_id
 from d2lbook import markdown
 from d2lbook import common
 from d2lbook import config
+from d2lbook import cache
+from d2lbook import utils
+from d2lbook import profiler
+from d2lbook._version import __version__
 
 def create_new_notebook(
         nb: notebooknode.NotebookNode,
@@ -26,13 +35,107 @@ def read(fname: str):
     with open(fname, 'r') as f:
         return nbformat.read(f, as_version=4)
 
-def read_markdown(source: Union[str, List[str]]) -> notebooknode.NotebookNode:
+def read_markdown(source: Union[str, List[str]],
+                  match: str = 'strict') -> notebooknode.NotebookNode:
     """Returns a notebook from markdown source"""
     if not isinstance(source, str):
         source = '\n'.join(source)
-    reader = notedown.MarkdownReader(match='strict')
+    reader = notedown.MarkdownReader(match=match)
     return reader.reads(source)
 
+# The parsed markdown files, a map from the hash of the content to the notebook
+# and the time to parse it.
+_parsed_markdowns = {}
+_parsed_markdowns_dir = None
+parsed_markdowns_stats = {'memory': 0, 'disk': 0, 'parsed': 0, 'saved': 0.0}
+
+_parser_version = None
+
+def _get_parser_version():
+    # notedown installed from git reports a fixed version, so also hash its code
+    global _parser_version
+    if _parser_version is None:
+        _parser_version = cache.hash_str(
+            __version__, notedown.__version__,
+            cache.hash_file(notedown.notedown.__file__))
+    return _parser_version
+
+def set_parsed_markdowns_dir(dirname: str):
+    """Also save the parsed markdown files in dirname to reuse across builds."""
+    global _parsed_markdowns_dir
+    _parsed_markdowns_dir = dirname
+
+def read_markdown_file(fname: str,
+                       match: str = 'strict') -> notebooknode.NotebookNode:
+    """Returns a notebook from a markdown file.
+
+    A file is only parsed once if its content is not changed, the returned
+    notebook is a copy that can be modified.
+    """
+    with open(fname, 'r', encoding='UTF-8') as f:
+        source = f.read()
+    key = cache.hash_str(_get_parser_version(), match, source)
+    stats = parsed_markdowns_stats
+    cache_fname = None
+    if _parsed_markdowns_dir:
+        cache_fname = os.path.join(_parsed_markdowns_dir, key + '.json')
+    if key in _parsed_markdowns:
+        stats['memory'] += 1
+        stats['saved'] += _parsed_markdowns[key][1]
+    elif cache_fname and os.path.exists(cache_fname):
+        with open(cache_fname, 'r') as f:
+            parsed = json.load(f)
+        # mark it as used, see prune_parsed_markdowns
+        os.utime(cache_fname)
+        _parsed_markdowns[key] = (nbformat.from_dict(parsed['notebook']),
+                                  parsed['parse_time'])
+        stats['disk'] += 1
+        stats['saved'] += parsed['parse_time']
+    else:
+        tik = time.time()
+        nb = read_markdown(source, match)
+        _parsed_markdowns[key] = (nb, time.time() - tik)
+        profiler.add_span(f'parse {fname}', tik, time.time() - tik, 'markdown')
+        stats['parsed'] += 1
+        if cache_fname:
+            utils.mkdir(_parsed_markdowns_dir)
+            with open(cache_fname + '.tmp', 'w') as f:
+                json.dump({'notebook': nb,
+                           'parse_time': _parsed_markdowns[key][1]}, f)
+            os.replace(cache_fname + '.tmp', cache_fname)
+    nb = copy.deepcopy(_parsed_markdowns[key][0])
+    # cell ids should be unique, e.g. after merging the notebooks of all tabs
+    for cell in nb.cells:
+        if 'id' in cell:
+            cell.id = random_cell_id()
+    return nb
+
+def prune_parsed_markdowns(max_days: float):
+    """Remove the parsed markdown files saved on disk that are not used in the
+    last max_days days."""
+    if (not max_days or not _parsed_markdowns_dir or
+            not os.path.exists(_parsed_markdowns_dir)):
+        return
+    since = time.time() - max_days * 86400
+    unused = [os.path.join(_parsed_markdowns_dir, fn)
+              for fn in os.listdir(_parsed_markdowns_dir)
+              if fn.endswith('.json') and os.path.getmtime(
+                  os.path.join(_parsed_markdowns_dir, fn)) < since]
+    for fn in unused:
+        os.remove(fn)
+    if unused:
+        logging.info(f'Removed {len(unused)} parsed markdown files in '
+                     f'{_parsed_markdowns_dir} unused in {max_days} days')
+
+def log_parsed_markdowns_summary():
+    stats = parsed_markdowns_stats
+    if not sum([stats['memory'], stats['disk'], stats['parsed']]):
+        return
+    logging.info(
+        f'Markdown files: {stats["parsed"]} parsed, reused {stats["memory"]} '
+        f'in memory and {stats["disk"]} on disk, saved '
+        f'{stats["saved"]:.2f} sec of parsing')
+
 def split_markdown_cell(
         nb: notebooknode.NotebookNode) -> notebooknode.NotebookNode:
     """split a markdown cell if it contains tab block.
@@ -351,9 +454,7 @@ def get_toc(root, flat=True):
 def _get_subpages(input_fn):
     """read toc in input_fn, returns what it contains"""
     subpages = []
-    reader = notedown.MarkdownReader()
-    with open(input_fn, 'r', encoding='UTF-8') as f:
-        nb = reader.read(f)
+    nb = read_markdown_file(input_fn, match='all')
     for cell in nb.cells:
         if (cell.cell_type == 'code' and 'attributes' in cell.metadata and
                 'toc' in cell.metadata.attributes['classes']):
@@ -3,6 +3,9 @@ from d2lbook import build
 from d2lbook import common
 import unittest
 import nbconvert
+import os
+import tempfile
+import time
 
 # 8 blocks:
 # 0: markdown
@@ -168,6 +171,48 @@ class TestNotebook(unittest.TestCase):
         self.assertRegex(cells[4].source, 'mdl-tabs__panel.*python3')
         self.assertRegex(cells[7].source, 'mdl-tabs__panel.*python2')
         self.assertRegex(cells[11].source, 'mdl-tabs__panel.*python4')
+
+    def test_read_markdown_file(self):
+        stats = notebook.parsed_markdowns_stats
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'a.md')
+            with open(fname, 'w') as f:
+                f.write(_markdown_src)
+            notebook.set_parsed_markdowns_dir(os.path.join(root, 'parsed'))
+            parsed = stats['parsed']
+            expected = build._notebook_hash(
+                notebook.read_markdown(_markdown_src))
+            nb = notebook.read_markdown_file(fname)
+            self.assertEqual(build._notebook_hash(nb), expected)
+            nb.cells = []
+            memory = stats['memory']
+            self.assertEqual(
+                build._notebook_hash(notebook.read_markdown_file(fname)),
+                expected)
+            self.assertEqual(stats['memory'], memory + 1)
+            # a new process
+            notebook._parsed_markdowns = {}
+            disk = stats['disk']
+            self.assertEqual(
+                build._notebook_hash(notebook.read_markdown_file(fname)),
+                expected)
+            self.assertEqual(stats['disk'], disk + 1)
+            self.assertEqual(stats['parsed'], parsed + 1)
+            # only remove the ones unused for long
+            parsed_dir = os.path.join(root, 'parsed')
+            unused = os.path.join(parsed_dir, 'unused.json')
+            with open(unused, 'w') as f:
+                f.write('{}')
+            os.utime(unused, (0, 0))
+            notebook.prune_parsed_markdowns(0)
+            self.assertEqual(len(os.listdir(parsed_dir)), 2)
+            notebook.prune_parsed_markdowns(30)
+            self.assertEqual(len(os.listdir(parsed_dir)), 1)
+            used = os.path.join(parsed_dir, os.listdir(parsed_dir)[0])
+            os.utime(used, (time.time() - 86400, ) * 2)
+            notebook.prune_parsed_markdowns(30)
+            self.assertEqual(os.listdir(parsed_dir), [os.path.basename(used)])
+            notebook.set_parsed_markdowns_dir(None)
         
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+"""Record the time spent in each part of a build as a Chrome trace"""
+import collections
+import contextlib
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# The directory the spans are recorded into. It's passed by the environment,
+# so the processes started by the build, such as the notebook evaluations,
+# record into the same directory.
+PROFILE_ENV = 'D2LBOOK_PROFILE_DIR'
+
+def enable():
+    """Start recording spans."""
+    if not enabled():
+        os.environ[PROFILE_ENV] = tempfile.mkdtemp(prefix='d2lbook_profile_')
+
+def enabled():
+    return bool(os.environ.get(PROFILE_ENV))
+
+def add_span(name: str, start: float, duration: float, cat: str = '', **args):
+    """Record a span starting at start, both are in seconds."""
+    trace_dir = os.environ.get(PROFILE_ENV)
+    if not trace_dir:
+        return
+    event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': int(start * 1e6),
+             'dur': int(duration * 1e6), 'pid': os.getpid(),
+             'tid': threading.get_native_id(), 'args': args}
+    # each process appends to its own file
+    with open(os.path.join(trace_dir, f'{os.getpid()}.jsonl'), 'a') as f:
+        f.write(json.dumps(event) + '\n')
+
+@contextlib.contextmanager
+def span(name: str, cat: str = '', **args):
+    """Record the time spent in the with block."""
+    if not enabled():
+        yield
+        return
+    tik = time.time()
+    try:
+        yield
+    finally:
+        add_span(name, tik, time.time() - tik, cat, **args)
+
+def save(trace_fname: str, top: int = 20):
+    """Stop recording and save the spans into trace_fname.
+
+    The file is in the Chrome trace format, which can be opened by
+    chrome://tracing or https://ui.perfetto.dev. The total time of each
+    category and the top spans are logged.
+    """
+    trace_dir = os.environ.pop(PROFILE_ENV, None)
+    if not trace_dir:
+        return
+    events = []
+    for fn in glob.glob(os.path.join(trace_dir, '*.jsonl')):
+        with open(fn) as f:
+            events.extend([json.loads(l) for l in f if l.strip()])
+    shutil.rmtree(trace_dir, ignore_errors=True)
+    events.sort(key=lambda e: e['ts'])
+    if os.path.dirname(trace_fname):
+        os.makedirs(os.path.dirname(trace_fname), exist_ok=True)
+    with open(trace_fname, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    logging.info(f'Saved {len(events)} spans into {trace_fname}')
+    logging.info(summarize(events, top))
+
+def summarize(events, top=20):
+    """Return the total time per category and the top spans by total time.
+
+    A span and the spans nested in it are counted separately.
+    """
+    by_cat = collections.defaultdict(float)
+    by_name = collections.defaultdict(lambda: [0, 0.0, 0.0])
+    for e in events:
+        seconds = e['dur'] / 1e6
+        by_cat[e['cat']] += seconds
+        s = by_name[(e['cat'], e['name'])]
+        s[0] += 1
+        s[1] += seconds
+        s[2] = max(s[2], seconds)
+    lines = ['Total seconds per category:']
+    for cat, seconds in sorted(by_cat.items(), key=lambda x: -x[1]):
+        lines.append(f'  {cat or "(none)":<12}{seconds:>10.1f}')
+    lines.append(f'Top {top} spans:')
+    lines.append(f'  {"count":>6}{"total":>10}{"max":>10}  name')
+    for (cat, name), (count, total, longest) in sorted(
+            by_name.items(), key=lambda x: -x[1][1])[:top]:
+        lines.append(f'  {count:>6}{total:>10.1f}{longest:>10.1f}  '
+                     f'[{cat}] {name}')
+    return '\n'.join(lines)
@@ -0,0 +1,31 @@
+from d2lbook import profiler
+import unittest
+import json
+import multiprocessing as mp
+import os
+import tempfile
+
+def _child():
+    with profiler.span('child', 'test'):
+        pass
+
+class TestProfiler(unittest.TestCase):
+    def test_save(self):
+        with profiler.span('disabled'):
+            pass
+        profiler.enable()
+        with profiler.span('parent', 'test', index=1):
+            p = mp.Process(target=_child)
+            p.start()
+            p.join()
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'trace.json')
+            with self.assertLogs() as logs:
+                profiler.save(fname)
+            self.assertFalse(profiler.enabled())
+            with open(fname) as f:
+                events = json.load(f)['traceEvents']
+        self.assertEqual(sorted([e['name'] for e in events]),
+                         ['child', 'parent'])
+        self.assertEqual(len(set([e['pid'] for e in events])), 2)
+        self.assertIn('[test] parent', logs.output[1])
@@ -0,0 +1,61 @@
+"""Summarize the cell statistics saved in the evaluated notebooks"""
+import collections
+import os
+from typing import Any, Dict, List
+
+from d2lbook import notebook, utils
+
+# Outputs larger than it in bytes are flagged, they bloat the HTML pages
+LARGE_OUTPUT_SIZE = 1 << 20
+
+def collect(eval_dir: str) -> List[Dict[str, Any]]:
+    """Return the statistics of the executed code cells in eval_dir."""
+    cells = []
+    for fn in utils.find_files('**/*.ipynb', eval_dir):
+        nb = notebook.read(fn)
+        if not nb:
+            continue
+        for i, cell in enumerate(nb.cells):
+            stats = cell.metadata.get('d2lbook')
+            if cell.cell_type != 'code' or not stats:
+                continue
+            lines = cell.source.strip().split('\n')
+            cells.append(dict(
+                stats, notebook=os.path.relpath(fn, eval_dir), index=i,
+                source=lines[0][:50] + (' ...' if len(lines) > 1 else '')))
+    return cells
+
+def format_report(cells: List[Dict[str, Any]], top: int = 10) -> str:
+    """Return the slowest notebooks and cells, and the largest outputs."""
+    if not cells:
+        return 'No cell statistics found, evaluate the notebooks first'
+    notebooks = collections.defaultdict(lambda: [0, 0.0, 0.0, 0])
+    for c in cells:
+        nb = notebooks[c['notebook']]
+        nb[0] += 1
+        nb[1] += c['time']
+        nb[2] = max(nb[2], c['peak_memory'] or 0)
+        nb[3] += c['output_size']
+    lines = [f'{len(cells)} cells in {len(notebooks)} notebooks took '
+             f'{sum(c["time"] for c in cells):.1f} sec']
+    lines.append(f'Top {top} slowest notebooks:')
+    lines.append(f'  {"sec":>8}{"cells":>7}{"peak GB":>9}{"output KB":>11}'
+                 '  notebook')
+    for fn, (count, seconds, memory, size) in sorted(
+            notebooks.items(), key=lambda x: -x[1][1])[:top]:
+        lines.append(f'  {seconds:>8.1f}{count:>7}{memory:>9.2f}'
+                     f'{size / 1024:>11.1f}  {fn}')
+    lines.append(f'Top {top} slowest cells:')
+    for c in sorted(cells, key=lambda c: -c['time'])[:top]:
+        lines.append(f'  {c["time"]:>8.1f} sec  {c["notebook"]} cell '
+                     f'{c["index"]}: {c["source"]}')
+    lines.append(f'Top {top} largest outputs:')
+    for c in sorted(cells, key=lambda c: -c['output_size'])[:top]:
+        flag = ' (too large)' if c['output_size'] > LARGE_OUTPUT_SIZE else ''
+        lines.append(f'  {c["output_size"] / 1024:>8.1f} KB{flag}  '
+                     f'{c["notebook"]} cell {c["index"]}: {c["source"]}')
+    num_large = len([c for c in cells if c['output_size'] > LARGE_OUTPUT_SIZE])
+    if num_large:
+        lines.append(f'{num_large} cells have outputs larger than '
+                     f'{LARGE_OUTPUT_SIZE >> 20} MB')
+    return '\n'.join(lines)
@@ -0,0 +1,28 @@
+from d2lbook import report
+import unittest
+import os
+import tempfile
+import nbformat
+from nbformat import v4
+
+class TestReport(unittest.TestCase):
+    def test_report(self):
+        cells = [v4.new_markdown_cell('# Title')]
+        for i, (seconds, size) in enumerate([(3, 100), (1, 2 << 20)]):
+            cell = v4.new_code_cell(f'cell{i}()\nmore')
+            cell.metadata['d2lbook'] = {
+                'time': seconds, 'peak_memory': 0.5, 'output_size': size}
+            cells.append(cell)
+        with tempfile.TemporaryDirectory() as eval_dir:
+            os.makedirs(os.path.join(eval_dir, 'ch'))
+            with open(os.path.join(eval_dir, 'ch/a.ipynb'), 'w') as f:
+                f.write(nbformat.writes(v4.new_notebook(cells=cells)))
+            stats = report.collect(eval_dir)
+        self.assertEqual([(c['notebook'], c['index'], c['source'])
+                          for c in stats], [('ch/a.ipynb', 1, 'cell0() ...'),
+                                            ('ch/a.ipynb', 2, 'cell1() ...')])
+        lines = report.format_report(stats, top=1).split('\n')
+        self.assertEqual(lines[0], '2 cells in 1 notebooks took 4.0 sec')
+        self.assertIn('ch/a.ipynb cell 1', lines[5])
+        self.assertIn('(too large)  ch/a.ipynb cell 2', lines[7])
+        self.assertEqual(lines[8], '1 cells have outputs larger than 1 MB')
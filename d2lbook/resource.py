@@ -1,22 +1,36 @@
 """Manage compute resources
 """
+import collections
 import dataclasses
 import datetime
 import logging
 import multiprocessing as mp
+from multiprocessing import connection
 import os
 import random
+import re
+import shutil
+import signal
 import subprocess
+import tempfile
 import threading
 import time
 import traceback
 from typing import Any, Optional, Sequence
 import getpass
+import json
 
 import fasteners
 
 from d2lbook import utils
 
+# The environment variable to pass the file where the process evaluating a
+# notebook reports the cell it's running.
+PROGRESS_ENV = 'D2LBOOK_PROGRESS_FILE'
+
+# A task is stalled if it uses less CPU time than this fraction of the wall time
+STALL_CPU_RATIO = 0.01
+
 def get_available_gpus():
     """Return a list of available GPUs with their names"""
     cmd = 'nvidia-smi --query-gpu=name --format=csv,noheader'
@@ -27,10 +41,145 @@ def get_available_gpus():
         return stdout.decode().splitlines()
     return []
 
+def get_total_memory():
+    """Return the physical memory in GB, or 0 if unknown."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2**30
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+def _read_proc():
+    """Return the children, the resident memory in GB and the used CPU time in
+    seconds of all processes."""
+    children, rss, cpu = {}, {}, {}
+    page_size = os.sysconf('SC_PAGE_SIZE') / 2**30
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:  # the process has exited
+            continue
+        # skip the command name, which may contain spaces
+        fields = stat[stat.rfind(')') + 2:].split()
+        pid = int(name)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+        cpu[pid] = (int(fields[11]) + int(fields[12])) / clock_ticks
+    return children, rss, cpu
+
+def _get_process_trees(children, pid_groups):
+    """Return the pids of each group of processes and their descendants."""
+    trees = []
+    for pids in pid_groups:
+        visited, stack = set(), list(pids)
+        while stack:
+            pid = stack.pop()
+            if pid in visited:
+                continue
+            visited.add(pid)
+            stack.extend(children.get(pid, []))
+        trees.append(visited)
+    return trees
+
+def get_peak_memory(pid: int):
+    """Return the peak resident memory in GB of a process, or None if not
+    supported by the OS."""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**20
+    except OSError:
+        pass
+    return None
+
+def get_process_tree_usage(pid_groups: Sequence[Sequence[int]]):
+    """Return the total resident memory in GB and the total CPU time in
+    seconds of each group of processes and their descendants. Return None if
+    not supported by the OS."""
+    if not os.path.exists('/proc/self/stat'):
+        return None
+    children, rss, cpu = _read_proc()
+    return [(sum([rss.get(pid, 0) for pid in tree]),
+             sum([cpu.get(pid, 0) for pid in tree]))
+            for tree in _get_process_trees(children, pid_groups)]
+
+def kill_process_trees(pids: Sequence[int]):
+    """Kill the processes and their descendants."""
+    if os.path.exists('/proc/self/stat'):
+        children, _, _ = _read_proc()
+        pids = _get_process_trees(children, [pids])[0]
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:  # the process has exited
+            pass
+
+def get_notebook_resources(notebook):
+    """Return the resources specified by the mark in a notebook.
+
+    The mark is a comment line in a code cell, such as
+    `#@eval_resource cpus=4, gpus=2, memory=30`, where memory is in GB.
+    """
+    resources = {}
+    for cell in notebook.cells:
+        if cell.cell_type != 'code':
+            continue
+        for line in cell.source.split('\n'):
+            m = re.match(r'^\s*#\s*@eval_resource\b(.*)$', line)
+            if not m:
+                continue
+            for item in re.split(r'[,\s]+', m[1].strip()):
+                if not item:
+                    continue
+                key, _, value = item.partition('=')
+                if key not in ('cpus', 'gpus', 'memory'):
+                    raise ValueError(f'Unknown resource "{key}" in "{line}"')
+                resources[key] = float(value) if key == 'memory' else int(value)
+    return resources
+
+def _get_timeout_mark(source):
+    timeouts = {}
+    for line in source.split('\n'):
+        m = re.match(r'^\s*#\s*@eval_timeout\b(.*)$', line)
+        if not m:
+            continue
+        for item in re.split(r'[,\s]+', m[1].strip()):
+            if not item:
+                continue
+            key, _, value = item.partition('=')
+            if key not in ('cell', 'notebook'):
+                raise ValueError(f'Unknown timeout "{key}" in "{line}"')
+            timeouts[key] = int(value)
+    return timeouts
+
+def get_cell_timeout(cell):
+    """Return the timeout in seconds specified by the mark in a code cell.
+
+    The mark is a comment line such as `#@eval_timeout cell=3600`, 0 means no
+    limit. Return None if not specified.
+    """
+    if cell.cell_type != 'code':
+        return None
+    return _get_timeout_mark(cell.source).get('cell')
+
+def get_notebook_timeout(notebook):
+    """Return the timeout in seconds of a whole notebook specified by a mark
+    such as `#@eval_timeout notebook=7200` in a code cell, 0 means no limit.
+    Return None if not specified."""
+    timeout = None
+    for cell in notebook.cells:
+        if cell.cell_type == 'code':
+            timeout = _get_timeout_mark(cell.source).get('notebook', timeout)
+    return timeout
+
 def get_notebook_gpus(notebook, max_gpus):
     """Return the # of GPUs needed for a notebook."""
-    # several heuristics, not necessary accurate
-    # TODO(mli) support a special mark in notebook to hint the #gpus
+    # several heuristics, not necessary accurate, use get_notebook_resources
+    # to get the number specified by a mark
     single_gpu_patterns = ('gpu()', 'gpu(0)', 'device(\'cuda\')',
                            'device(\'/GPU:0\')', 'try_gpu()', 'try_gpu(0)', 'gpus=1')
     all_gpus_patterns = ('gpu(1)', 'device(\'cuda:1\')', 'device(\'/GPU:1\')',
@@ -45,15 +194,47 @@ def get_notebook_gpus(notebook, max_gpus):
                 n_gpus = max(n_gpus, max_gpus)
     return n_gpus
 
+def report_progress(index: int, num_cells: int):
+    """Report the cell index the current task is running to the scheduler."""
+    fname = os.environ.get(PROGRESS_ENV)
+    if not fname:
+        return
+    try:
+        utils.write_if_changed(fname,
+                               json.dumps([index, num_cells, time.time()]))
+    except OSError:  # the scheduler has finished
+        pass
+
+def _read_progress(fname):
+    if not fname:
+        return None
+    try:
+        with open(fname, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 @dataclasses.dataclass
 class _Task():
     num_cpus: int
     num_gpus: int
+    memory: Optional[float]
     target: Any
     args: Sequence[Any]
     description: str
+    name: str
+    callback: Optional[Any] = None
+    kernel: Optional[str] = None
+    timeout: float = 0
+    env: Optional[Any] = None
+    predicted_runtime: float = 0
+    peak_memory: float = 0
     process: Optional[Any] = None
     locks: Sequence[int] = dataclasses.field(default_factory=list)
+    progress_fname: Optional[str] = None
+    # the (time, CPU time, cell index) sampled in the last stall_timeout seconds
+    usage: Any = dataclasses.field(default_factory=collections.deque)
+    killed: Optional[str] = None
     done: bool = False
     start_time: datetime.datetime = datetime.datetime.now()
     end_time: Optional[datetime.datetime] = None
@@ -79,10 +260,34 @@ class Process(mp.Process):
         return self._exception
 
 class Scheduler():
-    """A schedule run multiple jobs in parallel under the resource constraint."""
-    def __init__(self, num_cpu_workers, num_gpu_workers):
+    """A schedule run multiple jobs in parallel under the resource constraint.
+
+    If history_fname is given, the runtime of each task is saved into it, and
+    tasks with longer historical runtimes are started first in later runs. If
+    kernel_pool is given, tasks with a kernel key get a warm kernel from it.
+
+    memory is the total memory in GB shared by the running tasks, 0 means
+    unlimited. A task is only started if its memory fits into the memory not
+    used by the running tasks. The peak memory of each task, including its
+    child processes, is measured and saved into the history, which is used as
+    the memory of the task in later runs. task_memory is the memory of a task
+    that is neither specified nor measured before.
+
+    If dashboard is given, its update method is called with the status every
+    second while running.
+
+    A task running longer than its timeout is killed and reported as failed.
+    If stall_timeout is larger than 0, a task is also killed if its processes
+    barely use CPU and it doesn't start a new cell, reported through
+    report_progress, in the last stall_timeout seconds.
+    """
+    def __init__(self, num_cpu_workers, num_gpu_workers, history_fname=None,
+                 kernel_pool=None, memory=0, task_memory=0, dashboard=None,
+                 stall_timeout=0):
         self._num_cpus = num_cpu_workers
         self._num_gpus = num_gpu_workers
+        self._memory = memory
+        self._task_memory = task_memory
         self._locks = [False] * (self._num_cpus + self._num_gpus)
         user = getpass.getuser()
         self._inter_locks = [
@@ -92,11 +297,27 @@ class Scheduler():
                 for i in range(self._num_gpus)]
         self._tasks = []
         self._failed_tasks = []
-        self._start_job_lock = fasteners.InterProcessLock(
-            f'/tmp/d2lbook_{user}_start_job')
+        self._makespan = 0
+        self._history_fname = history_fname
+        self._kernel_pool = kernel_pool
+        self._dashboard = dashboard
+        self._stall_timeout = stall_timeout
+        self._history = {}
+        if history_fname and os.path.exists(history_fname):
+            with open(history_fname, 'r') as f:
+                self._history = json.load(f)
+
+    def add(self, num_cpus, num_gpus, target, args, description='',
+            callback=None, name=None, kernel=None, memory=None, timeout=0):
+        """Add tasks into the queue.
 
-    def add(self, num_cpus, num_gpus, target, args, description=''):
-        """Add tasks into the queue."""
+        callback, if given, is called without arguments in the current process
+        once the task finished successfully. name is the unique task name to
+        look up its history, the default value is description. kernel is the
+        key to get a warm kernel from the kernel pool. memory is the memory in
+        GB the task needs, if None, then use the peak memory in the history.
+        timeout is the maximal runtime in seconds, 0 means unlimited.
+        """
         assert not (num_cpus == 0 and num_gpus == 0), \
                 'Need at least one CPU or GPU'
         assert num_cpus <= self._num_cpus and num_gpus <= self._num_gpus, \
@@ -104,14 +325,91 @@ class Scheduler():
 
         if not description:
             description = f'Target {target} with args {args}'
-        self._tasks.append(_Task(num_cpus, num_gpus, target, args,
-                                 description))
+        self._tasks.append(_Task(num_cpus, num_gpus, memory, target, args,
+                                 description, name or description, callback,
+                                 kernel, timeout or 0))
+
+    @property
+    def num_cpu_workers(self):
+        return self._num_cpus
+
+    @property
+    def num_gpu_workers(self):
+        return self._num_gpus
 
     @property
     def failed_tasks(self):
         return [(task.description, err, trace)
                 for task, err, trace in self._failed_tasks]
 
+    @property
+    def task_stats(self):
+        """The name, runtime in seconds, peak memory in GB, devices and
+        status of each finished task."""
+        failed = set([id(task) for task, _, _ in self._failed_tasks])
+        stats = []
+        for task in self._tasks:
+            if not task.done:
+                continue
+            stats.append(dict(
+                name=task.name,
+                seconds=(task.end_time - task.start_time).total_seconds(),
+                peak_memory=task.peak_memory, num_cpus=task.num_cpus,
+                num_gpus=task.num_gpus,
+                status='failed' if id(task) in failed else 'ok'))
+        return stats
+
+    @property
+    def utilization(self):
+        """The fraction of the device time used by tasks in the last run."""
+        capacity = (self._num_cpus + self._num_gpus) * self._makespan
+        if not capacity:
+            return 0
+        return sum([s['seconds'] * (s['num_cpus'] + s['num_gpus'])
+                    for s in self.task_stats]) / capacity
+
+    @property
+    def status(self):
+        """The progress of the tasks, such as the queue depth, the task on each
+        device, the elapsed and predicted runtimes and the cell index of each
+        running task, and the predicted seconds to finish all tasks."""
+        now = time.time()
+        slots = [None] * len(self._locks)
+        running, remaining = [], [0] * len(self._locks)
+        for task in self._tasks:
+            if not task.process:
+                continue
+            elapsed = (datetime.datetime.now() -
+                       task.start_time).total_seconds()
+            item = dict(
+                name=task.name, description=task.description,
+                cpus=task.locks[:task.num_cpus],
+                gpus=[i - self._num_cpus for i in task.locks[task.num_cpus:]],
+                elapsed=elapsed, predicted=task.predicted_runtime,
+                peak_memory=task.peak_memory)
+            progress = _read_progress(task.progress_fname)
+            if progress:
+                item.update(cell=progress[0], num_cells=progress[1],
+                            cell_elapsed=now - progress[2])
+            running.append(item)
+            for lock in task.locks:
+                slots[lock] = task.name
+                remaining[lock] = max(task.predicted_runtime - elapsed, 0)
+        waiting = [
+            task for task in self._tasks if not task.process and not task.done]
+        eta = None
+        if any([task.predicted_runtime for task in self._tasks]):
+            eta = self._predict_makespan(waiting, remaining[:self._num_cpus],
+                                         remaining[self._num_cpus:])
+        devices = [f'CPU {i}' for i in range(self._num_cpus)] + [
+            f'GPU {i}' for i in range(self._num_gpus)]
+        return dict(
+            time=now, num_tasks=len(self._tasks),
+            num_done=len([task for task in self._tasks if task.done]),
+            num_failed=len(self._failed_tasks), num_queued=len(waiting),
+            running=running, eta=eta, slots=[
+                dict(device=d, task=t) for d, t in zip(devices, slots)])
+
     @property
     def error_message(self):
         if not self.failed_tasks:
@@ -130,6 +428,7 @@ class Scheduler():
             info = []
             if cpus: info.append(f'CPU {cpus}')
             if gpus: info.append(f'GPU {gpus}')
+            if task.memory: info.append(f'{task.memory:.1f}GB memory')
             return ', '.join(info)
 
         def _runtime(task):
@@ -145,8 +444,14 @@ class Scheduler():
                 self._tasks.sort(
                     key=lambda task: (task.end_time - task.start_time).seconds)
                 for task in self._tasks:
+                    predicted = ''
+                    if task.predicted_runtime:
+                        predicted = f' (predicted {utils.format_seconds(task.predicted_runtime)})'
+                    peak = ''
+                    if task.peak_memory:
+                        peak = f', peak memory {task.peak_memory:.1f}GB'
                     logging.info(
-                        f'  - {_runtime(task)} on {_device_info(task)} for {task.description}'
+                        f'  - {_runtime(task)}{predicted} on {_device_info(task)}{peak} for {task.description}'
                     )
 
         def _status():
@@ -161,74 +466,249 @@ class Scheduler():
             )
             for task in self._tasks:
                 if task.process:
+                    progress = _read_progress(task.progress_fname)
+                    cell = ''
+                    if progress:
+                        cell = f', at cell {progress[0] + 1}/{progress[1]}'
                     logging.info(
-                        f'    - Task "{task.description}" on {_device_info(task)} is running for {_runtime(task)}'
+                        f'    - Task "{task.description}" on {_device_info(task)} is running for {_runtime(task)}{cell}'
                     )
 
-        # try large gpu workloads first
-        self._tasks.sort(reverse=True, key=lambda task:
-                         (task.num_gpus, task.num_cpus))
+        def _start(task):
+            # a task may use more memory than predicted
+            used_memory = sum([
+                max(t.memory, t.peak_memory) for t in self._tasks
+                if t.process])
+            if self._memory and used_memory + task.memory > self._memory:
+                return False
+            locks = self._lock(0, self._num_cpus, task.num_cpus) + \
+                    self._lock(self._num_cpus, self._num_cpus+self._num_gpus, task.num_gpus)
+            if len(locks) < task.num_cpus + task.num_gpus:
+                self._unlock(locks)
+                return False
+            task.locks = locks
+            message = f'Starting task "{task.description}" on {_device_info(task)}'
+            logging.info(message)
+            task.start_time = datetime.datetime.now()
+            gpus = [i - self._num_cpus for i in locks[task.num_cpus:]]
+            task.env = {}
+            if self._kernel_pool and task.kernel is not None:
+                task.env = self._kernel_pool.acquire(task.kernel)
+            task.progress_fname = os.path.join(progress_dir,
+                                               f'{id(task)}.json')
+            env = dict(task.env, **{PROGRESS_ENV: task.progress_fname})
+            task.process = Process(target=_target,
+                                   args=(gpus, env, task.target, *task.args))
+            task.process.start()
+            return True
 
-        last_status_t = 0
-        for t in range(24 * 60 * 60):  # run at most 24 hours
-            if all([task.done for task in self._tasks]):
-                break
+        def _pids(task):
+            pids = [task.process.pid]
+            if task.env:
+                pids.append(self._kernel_pool.get_pid(task.env))
+            return pids
 
-            if t > last_status_t + 60:
-                last_status_t = t
-                _status()
+        def _kill(task, reason):
+            logging.error(f'Killing task "{task.description}" on {_device_info(task)}: {reason}')
+            task.killed = reason
+            kill_process_trees(_pids(task))
 
-            for task in self._tasks:
-                if task.process or task.done:
-                    continue
-                locks = self._lock(0, self._num_cpus, task.num_cpus) + \
-                        self._lock(self._num_cpus, self._num_cpus+self._num_gpus, task.num_gpus)
-                if len(locks) < task.num_cpus + task.num_gpus:
-                    self._unlock(locks)
+        def _measure_usage(tasks):
+            usage = get_process_tree_usage([_pids(task) for task in tasks])
+            now = time.time()
+            for task, (memory, cpu) in zip(tasks, usage or []):
+                task.peak_memory = max(task.peak_memory, memory)
+                if not self._stall_timeout or task.killed:
                     continue
-                task.locks = locks
-                # a brutal fix to https://github.com/jupyter/nbconvert/issues/1066
-                # if two ci jobs start to eval notebook at the same time, it may
-                # cause the port bind conflict. here i require the ci job to acquire
-                # a global lock for 1 sec.
-                self._start_job_lock.acquire()
-                message = f'Starting task "{task.description}" on {_device_info(task)}'
-                logging.info(message)
-                task.start_time = datetime.datetime.now()
-                gpus = [i - self._num_cpus for i in locks[task.num_cpus:]]
-                task.process = Process(target=_target,
-                                       args=(gpus, task.target, *task.args))
-                task.process.start()
-                _status()
-                last_status_t = t
-                time.sleep(1)
-                self._start_job_lock.release()
-                break
+                progress = _read_progress(task.progress_fname)
+                cell = progress[2] if progress else None
+                task.usage.append((now, cpu, cell))
+                # keep a single sample older than stall_timeout
+                while (len(task.usage) > 1 and
+                       task.usage[1][0] <= now - self._stall_timeout):
+                    task.usage.popleft()
+                start, start_cpu, start_cell = task.usage[0]
+                if (start <= now - self._stall_timeout and
+                        cpu - start_cpu < STALL_CPU_RATIO * (now - start) and
+                        cell == start_cell):
+                    _kill(task, f'Stalled, no CPU usage or new cell in the last {self._stall_timeout:.0f} sec')
 
-            # check if any one is finished
-            for task in self._tasks:
-                if task.done or not task.process: continue
-                if not task.process.is_alive():
-                    for lock in task.locks:
-                        self._locks[lock] = False
-                        self._inter_locks[lock].release()
-                    task.end_time = datetime.datetime.now()
-                    if task.process.exception:
-                        error, traceback = task.process.exception
-                        self._failed_tasks.append((task, error, traceback))
-                        logging.error(
-                            f'Task "{task.description}" on {_device_info(task)} exited with error: {error}\n{traceback}'
-                        )
-                    else:
-                        logging.info(
-                            f'Task "{task.description}" on {_device_info(task)} is finished in {_runtime(task)}'
-                        )
-                    task.process = None
-                    task.done = True
-
-            time.sleep(1)
+        def _check_timeouts(tasks):
+            for task in tasks:
+                runtime = (datetime.datetime.now() -
+                           task.start_time).total_seconds()
+                if task.timeout and runtime > task.timeout and not task.killed:
+                    _kill(task, f'Timed out after {task.timeout:.0f} sec')
 
+        def _finish(task):
+            task.process.join()
+            if task.env:
+                self._kernel_pool.release(task.env)
+            for lock in task.locks:
+                self._locks[lock] = False
+                self._inter_locks[lock].release()
+            task.end_time = datetime.datetime.now()
+            exception = task.process.exception
+            if task.killed:
+                exception = (TimeoutError(task.killed), '')
+            elif not exception and task.process.exitcode:
+                exception = (RuntimeError(
+                    f'Exited with code {task.process.exitcode}'), '')
+            if exception:
+                error, traceback = exception
+                self._failed_tasks.append((task, error, traceback))
+                logging.error(
+                    f'Task "{task.description}" on {_device_info(task)} exited with error: {error}\n{traceback}'
+                )
+            else:
+                logging.info(
+                    f'Task "{task.description}" on {_device_info(task)} is finished in {_runtime(task)}'
+                )
+                if task.callback:
+                    task.callback()
+            task.process = None
+            task.done = True
+
+        # start the tasks with longest runtimes first (LPT), and then try large
+        # gpu workloads first
+        self._predict_runtimes()
+        self._predict_memory()
+        self._tasks.sort(reverse=True, key=lambda task: (
+            task.predicted_runtime, task.num_gpus, task.num_cpus))
+        predicted_makespan = self._predict_makespan()
+
+        # sample the memory and CPU time of running tasks every second
+        measure_usage = get_process_tree_usage([]) is not None
+        # the running tasks report the cells they are running into files in it
+        progress_dir = tempfile.mkdtemp(prefix='d2lbook_')
+        tik = time.time()
+        last_status_t = tik
+        try:
+            while time.time() < tik + 24 * 60 * 60:  # run at most 24 hours
+                if all([task.done for task in self._tasks]):
+                    break
+                # start all tasks that fit into the free resources
+                started = False
+                for task in self._tasks:
+                    if not task.process and not task.done:
+                        started = _start(task) or started
+                if started:
+                    _status()
+                    last_status_t = time.time()
+                if self._dashboard:
+                    self._dashboard.update(self.status)
+
+                running = [task for task in self._tasks if task.process]
+                waiting = any([
+                    not task.process and not task.done for task in self._tasks])
+                # wake up once a task exits, or periodically to print the
+                # status. if no task is running, the resources are used by
+                # other d2lbook processes, check again soon.
+                timeout = max(last_status_t + 60 - time.time(), 0)
+                if ((waiting and not running) or
+                    (running and (measure_usage or self._dashboard or
+                                  any([task.timeout for task in running])))):
+                    timeout = min(timeout, 1)
+                # also wait on the pipes so a child blocked on sending a large
+                # error message can exit
+                ready = connection.wait(
+                    [task.process.sentinel for task in running] +
+                    [task.process._pconn for task in running], timeout=timeout)
+                if measure_usage:
+                    _measure_usage(running)
+                _check_timeouts(running)
+                for task in running:
+                    if task.process._pconn in ready:
+                        task.process.exception
+                    if task.process.sentinel in ready:
+                        _finish(task)
+                if time.time() > last_status_t + 60:
+                    last_status_t = time.time()
+                    _status()
+        finally:
+            shutil.rmtree(progress_dir, ignore_errors=True)
+            if self._dashboard:
+                self._dashboard.update(self.status)
+
+        self._makespan = time.time() - tik
         _summary_heavy_tasks()
+        if predicted_makespan:
+            logging.info(
+                f'Predicted makespan {utils.format_seconds(predicted_makespan)}, actual makespan {utils.format_seconds(time.time() - tik)}'
+            )
+        self._save_history()
+
+    def _predict_runtimes(self):
+        known = [
+            self._history[task.name]['runtime'] for task in self._tasks
+            if 'runtime' in self._history.get(task.name, {})]
+        if not known:
+            return
+        # use the average for new tasks
+        default = sum(known) / len(known)
+        for task in self._tasks:
+            task.predicted_runtime = self._history.get(
+                task.name, {}).get('runtime', default)
+
+    def _predict_memory(self):
+        for task in self._tasks:
+            if task.memory is None:
+                history = self._history.get(task.name, {})
+                task.memory = self._task_memory
+                if 'memory' in history:
+                    # add a margin as the peak memory varies across runs
+                    task.memory = history['memory'] * 1.1
+            if self._memory and task.memory > self._memory:
+                logging.warning(
+                    f'Task "{task.description}" needs {task.memory:.1f}GB memory, more than the total {self._memory:.1f}GB'
+                )
+                task.memory = self._memory
+
+    def _predict_makespan(self, tasks=None, cpus=None, gpus=None):
+        """Simulate the scheduling with predicted runtimes.
+
+        tasks are the tasks to schedule, the default is all tasks. cpus and
+        gpus are the seconds until each device is free, the default is 0.
+        """
+        if not any([task.predicted_runtime for task in self._tasks]):
+            return 0
+        tasks = self._tasks if tasks is None else tasks
+        cpus = list(cpus) if cpus else [0] * self._num_cpus
+        gpus = list(gpus) if gpus else [0] * self._num_gpus
+        makespan = max([0] + cpus + gpus)
+        for task in tasks:
+            cpus.sort()
+            gpus.sort()
+            # wait until enough cpus and gpus are free
+            start = max([0] + cpus[:task.num_cpus] + gpus[:task.num_gpus])
+            end = start + task.predicted_runtime
+            cpus[:task.num_cpus] = [end] * task.num_cpus
+            gpus[:task.num_gpus] = [end] * task.num_gpus
+            makespan = max(makespan, end)
+        return makespan
+
+    def _save_history(self):
+        if not self._history_fname:
+            return
+        failed = set([id(task) for task, _, _ in self._failed_tasks])
+        for task in self._tasks:
+            if not task.done:
+                continue
+            history = self._history.setdefault(task.name, {})
+            if task.peak_memory:
+                # a failed task, e.g. killed by OOM, may not reach its peak
+                if id(task) in failed:
+                    history['memory'] = max(history.get('memory', 0),
+                                            task.peak_memory)
+                else:
+                    history['memory'] = task.peak_memory
+            if id(task) not in failed:
+                history['runtime'] = (
+                    task.end_time - task.start_time).total_seconds()
+        if os.path.dirname(self._history_fname):
+            utils.mkdir(os.path.dirname(self._history_fname))
+        with open(self._history_fname, 'w') as f:
+            json.dump(self._history, f, indent=1, sort_keys=True)
 
     def _lock(self, start, end, n):
         ids = list(range(start, end))
@@ -248,9 +728,10 @@ class Scheduler():
             self._inter_locks[i].release()
             self._locks[i] = False
 
-def _target(gpus, target, *args):
+def _target(gpus, env, target, *args):
     if not gpus:
         # it will triggler an runtime error if target actually uses a gpu
         gpus = [""]
     os.environ['CUDA_VISIBLE_DEVICES'] = ','.join([str(g) for g in gpus])
+    os.environ.update(env)
     return target(*args)
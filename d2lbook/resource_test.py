@@ -3,11 +3,12 @@ Run multiple instances from terminal to test
 
 python d2lbook/resource_test.py
 """
-from d2lbook import resource
+from d2lbook import notebook, resource
 import unittest
 import time
 import logging
 import os
+import tempfile
 
 def _incorrect_code():
     for i in a:
@@ -16,6 +17,34 @@ def _incorrect_code():
 def _runtime_error():
     return 1 / 0
 
+def _report_progress():
+    for i in range(3):
+        resource.report_progress(i, 3)
+        time.sleep(1)
+
+def _allocate(gb):
+    data = b'1' * int(gb * 2**30)
+    time.sleep(2)
+
+_timeout_md = '''
+```{.python .input}
+#@eval_timeout notebook=7200
+x = 1
+```
+
+```{.python .input}
+# @eval_timeout cell=0
+y = 1
+```
+'''
+
+_md = '''
+```{.python .input}
+#@eval_resource cpus=4, gpus=2 memory=1.5
+x = 1
+```
+'''
+
 class TestResource(unittest.TestCase):
     def test_get_available_gpus(self):
         self.assertGreaterEqual(len(resource.get_available_gpus()), 0)
@@ -40,6 +69,112 @@ class TestResource(unittest.TestCase):
         self.assertEqual(len(scheduler.failed_tasks), 2)
         logging.info(scheduler.error_message)
 
+    def test_start_all_fitted_tasks(self):
+        scheduler = resource.Scheduler(num_cpu_workers=4, num_gpu_workers=0)
+        for _ in range(4):
+            scheduler.add(1, 0, time.sleep, (1,))
+        tik = time.time()
+        scheduler.run()
+        # all tasks run at the same time
+        self.assertLess(time.time() - tik, 3)
+
+    def test_memory(self):
+        scheduler = resource.Scheduler(4, 0, memory=2)
+        for _ in range(4):
+            scheduler.add(1, 0, time.sleep, (1,), memory=1)
+        tik = time.time()
+        scheduler.run()
+        # at most 2 tasks run at the same time
+        self.assertGreaterEqual(time.time() - tik, 2)
+
+    @unittest.skipUnless(os.path.exists('/proc'), 'needs /proc')
+    def test_peak_memory(self):
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'tasks.json')
+            scheduler = resource.Scheduler(1, 0, history_fname=fname)
+            scheduler.add(1, 0, _allocate, (0.5,), name='alloc')
+            scheduler.run()
+            scheduler = resource.Scheduler(1, 0, history_fname=fname)
+            scheduler.add(1, 0, _allocate, (0.5,), name='alloc')
+            scheduler._predict_memory()
+            self.assertGreater(scheduler._tasks[0].memory, 0.5)
+
+    def test_notebook_resources(self):
+        nb = notebook.read_markdown(_md)
+        self.assertEqual(resource.get_notebook_resources(nb),
+                         {'cpus': 4, 'gpus': 2, 'memory': 1.5})
+
+    def test_timeout_marks(self):
+        nb = notebook.read_markdown(_timeout_md)
+        self.assertEqual(resource.get_notebook_timeout(nb), 7200)
+        self.assertEqual([resource.get_cell_timeout(c) for c in nb.cells],
+                         [None, 0])
+
+    def test_timeout(self):
+        scheduler = resource.Scheduler(2, 0)
+        scheduler.add(1, 0, time.sleep, (30,), name='slow', timeout=1)
+        scheduler.add(1, 0, time.sleep, (0.1,), name='fast', timeout=10)
+        tik = time.time()
+        scheduler.run()
+        self.assertLess(time.time() - tik, 10)
+        self.assertEqual([s['status'] for s in scheduler.task_stats],
+                         ['ok', 'failed'])
+        self.assertIn('Timed out after 1 sec', scheduler.error_message)
+
+    @unittest.skipUnless(os.path.exists('/proc'), 'needs /proc')
+    def test_stall(self):
+        scheduler = resource.Scheduler(1, 0, stall_timeout=2)
+        scheduler.add(1, 0, time.sleep, (30,), name='stalled')
+        tik = time.time()
+        scheduler.run()
+        self.assertLess(time.time() - tik, 10)
+        self.assertIn('Stalled', scheduler.error_message)
+
+    def test_history(self):
+        with tempfile.TemporaryDirectory() as root:
+            fname = os.path.join(root, 'tasks.json')
+            scheduler = resource.Scheduler(1, 0, history_fname=fname)
+            scheduler.add(1, 0, time.sleep, (0.1,), name='short')
+            scheduler.add(1, 0, time.sleep, (1,), name='long')
+            scheduler.run()
+            scheduler = resource.Scheduler(2, 0, history_fname=fname)
+            scheduler.add(1, 0, time.sleep, (0.1,), name='short')
+            scheduler.add(1, 0, time.sleep, (1,), name='long')
+            scheduler.add(1, 0, time.sleep, (0.1,), name='new')
+            scheduler._predict_runtimes()
+            tasks = {task.name: task for task in scheduler._tasks}
+            self.assertGreater(tasks['long'].predicted_runtime,
+                               tasks['short'].predicted_runtime)
+            self.assertGreater(tasks['new'].predicted_runtime,
+                               tasks['short'].predicted_runtime)
+            scheduler._tasks.sort(reverse=True,
+                                  key=lambda task: task.predicted_runtime)
+            self.assertAlmostEqual(scheduler._predict_makespan(),
+                                   tasks['long'].predicted_runtime)
+
+    def test_status(self):
+        class Dashboard():
+            def __init__(self):
+                self.statuses = []
+
+            def update(self, status):
+                self.statuses.append(status)
+
+        dashboard = Dashboard()
+        scheduler = resource.Scheduler(1, 0, dashboard=dashboard)
+        scheduler.add(1, 0, _report_progress, (), name='progress')
+        scheduler.add(1, 0, time.sleep, (0.1,), name='queued')
+        scheduler.run()
+        first, last = dashboard.statuses[0], dashboard.statuses[-1]
+        self.assertEqual(first['num_queued'], 1)
+        self.assertEqual(first['slots'], [{'device': 'CPU 0',
+                                           'task': 'progress'}])
+        cells = [s['running'][0].get('cell') for s in dashboard.statuses
+                 if s['running'] and s['running'][0]['name'] == 'progress']
+        self.assertIn(2, cells)
+        self.assertEqual((last['num_done'], last['num_tasks'],
+                          last['running']), (2, 2, []))
+
 if __name__ == '__main__':
     logging.basicConfig(
         format='[d2lbook:%(filename)s:L%(lineno)d] %(levelname)-6s %(message)s'
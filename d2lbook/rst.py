@@ -8,12 +8,15 @@ from nbformat import notebooknode
 from d2lbook import notebook
 from d2lbook import common
 from d2lbook import markdown
+from d2lbook import profiler
 
 def convert_notebook(nb: notebooknode.NotebookNode, resources: Dict[str, str]):
     nb = _process_nb(nb)
     writer = nbconvert.RSTExporter()
-    body, resources = writer.from_notebook_node(nb, resources)
-    body = _process_rst(body)
+    with profiler.span('nbconvert', 'rst'):
+        body, resources = writer.from_notebook_node(nb, resources)
+    with profiler.span('process rst', 'rst'):
+        body = _process_rst(body)
     return body, resources
 
 def _process_nb(nb):
@@ -53,6 +56,8 @@ def _process_nb(nb):
 
 def _process_rst(body):
 
+    # every pass below is linear to the number of lines, deletes is a set of
+    # line indices
     def delete_lines(lines, deletes):
         return [line for i, line in enumerate(lines) if i not in deletes]
     def indented(line):
@@ -95,7 +100,7 @@ def _process_rst(body):
     #    +----------+----------------------------------------+
     # 
     # .. _tab_intro_decade:    
-    i, deletes = 0, []
+    i = 0
     while i < len(lines):
         line = lines[i]
         if line.startswith('Table: label:'):
@@ -116,7 +121,7 @@ def _process_rst(body):
         i += 1
 
     # deletes: indices of lines to be deleted
-    i, deletes = 0, []
+    i, deletes = 0, set()
     while i < len(lines):
         line = lines[i]
         # '.. code:: toc' -> '.. toctree::', then remove consecutive empty lines
@@ -125,7 +130,7 @@ def _process_rst(body):
             # convert into rst's toc block
             lines[i] = '.. toctree::'
             blanks = look_behind(i+1, blank, lines)
-            deletes.extend(blanks)
+            deletes.update(blanks)
             i += len(blanks)
         # .. code:: eval_rst
         #
@@ -144,7 +149,7 @@ def _process_rst(body):
         #    ==========
         elif line.startswith('.. code:: eval_rst'):
             # make it a rst block
-            deletes.append(i)
+            deletes.add(i)
             j = i + 1
             while j < len(lines):
                 line_j = lines[j]
@@ -186,7 +191,7 @@ def _process_rst(body):
         elif indented(line) and ':alt:' in line:
             # Image caption, remove :alt: block, it cause trouble for long captions
             caps = look_behind(i, lambda l: indented(l) and not blank(l), lines)
-            deletes.extend(caps)
+            deletes.update(caps)
             i += len(caps)
         # .. table:: Dataset versus computer memory and computational power
         #    +-...
@@ -215,7 +220,7 @@ def _process_rst(body):
 
     # change :label:my_label: into rst format
     lines = delete_lines(lines, deletes)
-    deletes = []
+    deletes = set()
 
     for i, line in enumerate(lines):
         pos, new_line = 0, ''
@@ -260,7 +265,7 @@ def _process_rst(body):
             elif key == 'eqlabel':
                 new_line += '   :label: '+value
                 if blank(lines[i-1]):
-                    deletes.append(i-1)
+                    deletes.add(i-1)
             elif key in ['width', 'height']:
                 new_line += '   :'+key+': '+value
             elif key == 'bibliography':
@@ -274,55 +279,83 @@ def _process_rst(body):
         lines[i] = new_line
     lines = delete_lines(lines, deletes)
 
-    def move(i, j): # move line i to line j
-        lines.insert(j, lines[i])
-        if i > j:
-            del lines[i+1]
+    # move :width: or :height: just below .. figure::, in the reversed order
+    new_lines, i = [], 0
+    while i < len(lines):
+        new_lines.append(lines[i])
+        if lines[i].startswith('.. figure::'):
+            sizes, others = [], []
+            i += 1
+            while (i < len(lines)
+                   and (indented(lines[i]) or blank(lines[i]))):
+                if (lines[i].startswith('   :width:')
+                    or lines[i].startswith('   :height:')):
+                    sizes.append(lines[i])
+                else:
+                    others.append(lines[i])
+                i += 1
+            new_lines.extend(sizes[::-1] + others)
         else:
-            del lines[i]
-
-    # move :width: or :width: just below .. figure::
-    for i, line in enumerate(lines):
-        if line.startswith('.. figure::'):
-            for j in range(i+1, len(lines)):
-                line_j = lines[j]
-                if not indented(line_j) and not blank(line_j):
-                    break
-                if line_j.startswith('   :width:') or line_j.startswith('   :height:'):
-                    move(j, i+1)
+            i += 1
+    lines = new_lines
 
-    # move .. _label: before a image, a section, or a table
+    # move .. _label: before a image, a section, or a table. lines are kept in
+    # a doubly linked list so moving a line is O(1)
     lines.insert(0, '')
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if line.startswith('.. _'):
-            for j in range(i-1, -1, -1):
-                line_j = lines[j]
-                if (line_j.startswith('.. table:')
-                    or line_j.startswith('.. figure:')):
-                    move(i, j-1)
-                    lines.insert(j-1, '')
-                    i += 1  # Due to insertion of a blank line
-                    break
-                if (len(set(line_j)) == 1
-                    and line_j[0] in ['=','~','_', '-']):
-                    k = max(j-2, 0)
-                    move(i, k)
-                    lines.insert(k, '')
-                    i += 1  # Due to insertion of a blank line
-                    break
-        i += 1
+    prev = list(range(-1, len(lines) - 1))
+    nxt = list(range(1, len(lines) + 1))
+    nxt[-1] = -1
 
-    # change .. image:: to .. figure:: to they will be center aligned
-    for i, line in enumerate(lines):
-        if '.. image::' in line:
-            lines[i] = line.replace('.. image::', '.. figure::')
+    def insert_before(node, line):
+        lines.append(line)
+        prev.append(prev[node])
+        nxt.append(node)
+        if prev[node] >= 0:
+            nxt[prev[node]] = len(lines) - 1
+        prev[node] = len(lines) - 1
+        return len(lines) - 1
+
+    def unlink(node):
+        if prev[node] >= 0:
+            nxt[prev[node]] = nxt[node]
+        if nxt[node] >= 0:
+            prev[nxt[node]] = prev[node]
 
-    # sometimes the code results contains vt100 codes, widely used for
-    # coloring, while it is not supported by latex.
-    for i, l in enumerate(lines):
+    # the last table, figure or section title underline seen, moved labels
+    # and inserted blank lines never match, so it is the one a backward search
+    # from the current line would find
+    head, anchor, node = 0, None, 0
+    while node >= 0:
+        line, next_node = lines[node], nxt[node]
+        if line.startswith('.. _') and anchor is not None:
+            if (lines[anchor].startswith('.. table:')
+                or lines[anchor].startswith('.. figure:')):
+                target = prev[anchor]
+            else:
+                target = prev[anchor]
+                if prev[target] >= 0:
+                    target = prev[target]
+            unlink(node)
+            new_node = insert_before(target, line)
+            blank_node = insert_before(new_node, '')
+            if target == head:
+                head = blank_node
+        elif (line.startswith('.. table:') or line.startswith('.. figure:')
+              or (len(set(line)) == 1 and line[0] in ['=','~','_', '-'])):
+            anchor = node
+        node = next_node
+    new_lines, node = [], head
+    while node >= 0:
+        new_lines.append(lines[node])
+        node = nxt[node]
+    lines = new_lines
+
+    for i, line in enumerate(lines):
+        # change .. image:: to .. figure:: to they will be center aligned
+        line = line.replace('.. image::', '.. figure::')
+        # sometimes the code results contains vt100 codes, widely used for
+        # coloring, while it is not supported by latex.
         lines[i] = re.sub(r'\x1b\[[\d;]*K', '',
-                          re.sub(r'\x1b\[[\d;]*m', '', l))
+                          re.sub(r'\x1b\[[\d;]*m', '', line))
 
     return '\n'.join(lines)
@@ -77,3 +77,16 @@ class TestRst(unittest.TestCase):
             if l.startswith(':math:`x=1`'):
                 self.assertEqual(l, ':math:`x=1`, :numref:`sec_2`')
 
+
+    def test_process_rst(self):
+        body = '\n'.join([
+            'Title', '=====', '', ':label:``sec_a``', '',
+            '.. figure:: ../img/a.png', '   :alt: a', '', '   caption', '',
+            ':height:``10px``', '', ':width:``20px``', '', ':label:``fig_a``'])
+        # a long chapter
+        lines = rst._process_rst('\n'.join([body] * 1000)).split('\n')
+        self.assertEqual(lines[:15], [
+            '', '.. _sec_a:', '', 'Title', '=====', '', '', '.. _fig_a:', '',
+            '.. figure:: ../img/a.png', '   :width: 20px', '   :height: 10px',
+            '', '   caption', ''])
+        self.assertEqual(lines.count('.. _fig_a:'), 1000)
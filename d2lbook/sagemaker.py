@@ -1,4 +1,5 @@
 """Integration with Sagemaker"""
+import functools
 import nbformat
 from d2lbook import utils
 from d2lbook import colab
@@ -20,14 +21,17 @@ class Sagemaker(colab.Colab):
     def generate_notebooks(self, eval_dir, sagemaker_dir, tab):
         if not self._valid:
             return
-        utils.run_cmd(['rm -rf', sagemaker_dir])
-        utils.run_cmd(['cp -r', eval_dir, sagemaker_dir])
-        notebooks = utils.find_files('**/*.ipynb', sagemaker_dir)
-        for fn in notebooks:
-            nb = notebook.read(fn)
-            if not nb:
-                continue
-            colab.update_notebook_kernel(nb, self._kernel[tab])
-            colab.insert_additional_installation(nb, self._libs[tab], self.config['libs_header'])
-            with open(fn, 'w') as f:
-                f.write(nbformat.writes(nb))
+        # only the notebooks changed since the last time are updated
+        key = repr((dict(self.config), self._libs.get(tab)))
+        utils.sync_dir(
+            eval_dir, sagemaker_dir, key,
+            functools.partial(self._update_notebook, sagemaker_dir, tab))
+
+    def _update_notebook(self, sagemaker_dir, tab, fn):
+        nb = notebook.read(fn)
+        if not nb:
+            return
+        colab.update_notebook_kernel(nb, self._kernel[tab])
+        colab.insert_additional_installation(nb, self._libs[tab], self.config['libs_header'])
+        with open(fn, 'w') as f:
+            f.write(nbformat.writes(nb))
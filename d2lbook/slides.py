@@ -27,8 +27,7 @@ def slides():
             logging.warning('Not found ' + fn)
             return
         for md in fns:
-            with open(md, 'r') as f:
-                nb = notebook.read_markdown(f.read())
+            nb = notebook.read_markdown_file(md)
             if tab:
                 nb = notebook.split_markdown_cell(nb)
                 nb = notebook.get_tab_notebook(nb, tab, cf.default_tab)
@@ -39,9 +39,9 @@ class SphinxEnv(object):
                 font_value = '\set%s{%s}' % (font.replace('_', ''), self.config.pdf[font])
             self._update_pyconf(font, font_value)
 
+        # only write changed files, so their mtimes are kept
         fname = os.path.join(self.config.rst_dir, 'conf.py')
-        with open(fname, 'w') as f:
-            f.write(self.pyconf)
+        utils.write_if_changed(fname, self.pyconf)
 
     def _update_pyconf(self, key, value):
         self.pyconf = self.pyconf.replace(key.upper(), value)
@@ -58,7 +58,7 @@ class SphinxEnv(object):
                 continue
             sphinx_fname = os.path.join(self.config.rst_dir, '_static',
                                         os.path.basename(fname))
-            utils.copy(fname, sphinx_fname)
+            utils.copy_if_changed(fname, sphinx_fname)
             self._update_pyconf(key, os.path.join(
                 '_static', os.path.basename(fname)))
 
@@ -78,20 +78,17 @@ class SphinxEnv(object):
             d2l_js += template.google_tracker.replace(
                 g_id.upper(), self.config.deploy[g_id])
 
-        os.makedirs(os.path.join(self.config.rst_dir, '_static'), exist_ok=True)
+        for include in utils.find_files(self.config.html['include_js'], self.config.src_dir):
+            with open(include, 'r') as fin:
+                d2l_js += fin.read()
         fname = os.path.join(self.config.rst_dir, '_static', 'd2l.js')
-        with open(fname, 'w') as f:
-            f.write(d2l_js)
-            for fname in utils.find_files(self.config.html['include_js'], self.config.src_dir):
-                with open (fname, 'r') as fin:
-                    f.write(fin.read())
+        utils.write_if_changed(fname, d2l_js)
 
     def _write_css(self):
         fname = os.path.join(self.config.rst_dir, '_static', 'd2l.css')
         d2l_css = template.hide_bibkey_css + template.copybutton_css + \
             template.limit_output_length_css + template.tabbar_css
-        with open(fname, 'w') as f:
-            f.write(d2l_css)
-            for fname in utils.find_files(self.config.html['include_css'], self.config.src_dir):
-                with open (fname, 'r') as fin:
-                    f.write(fin.read())
+        for include in utils.find_files(self.config.html['include_css'], self.config.src_dir):
+            with open(include, 'r') as fin:
+                d2l_css += fin.read()
+        utils.write_if_changed(fname, d2l_css)
@@ -2,6 +2,9 @@ import os
 import glob
 import shutil
 import logging
+import tempfile
+import concurrent.futures
+import json
 
 def rm_ext(filename):
     return os.path.splitext(filename)[0]
@@ -135,9 +138,136 @@ def copy(src, tgt):
     mkdir(os.path.dirname(tgt))
     shutil.copy(src, tgt)
 
+def write_if_changed(fname, content):
+    """Write content, a str or bytes, into fname if the file content differs.
+
+    The new content is written into a temporary file and then renamed, so a
+    reader never sees a partially written file. Returns if fname is written.
+    """
+    mode = 'b' if isinstance(content, bytes) else ''
+    if os.path.exists(fname):
+        with open(fname, 'r' + mode) as f:
+            if f.read() == content:
+                return False
+        permission = os.stat(fname).st_mode & 0o777
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        permission = 0o666 & ~umask
+    dirname = os.path.dirname(fname) or '.'
+    mkdir(dirname)
+    fd, tmp_fname = tempfile.mkstemp(dir=dirname, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'w' + mode) as f:
+            f.write(content)
+        # mkstemp creates the file only readable by the owner
+        os.chmod(tmp_fname, permission)
+        os.replace(tmp_fname, fname)
+    except BaseException:
+        os.remove(tmp_fname)
+        raise
+    return True
+
+def copy_if_changed(src, tgt):
+    """Copy src to tgt if their contents differ. Returns if tgt is written."""
+    with open(src, 'rb') as f:
+        return write_if_changed(tgt, f.read())
+
+
+# The file in a synced directory to record the source files synced
+_SYNC_MANIFEST = '.d2lbook_sync.json'
+
+def sync_dir(src_dir, tgt_dir, key='', update=None):
+    """Make tgt_dir a mirror of src_dir, returns the notebooks updated.
+
+    Only files added or changed since the last sync are updated, and files
+    no longer in src_dir are removed. Notebooks are copied, other files such
+    as images and data are hardlinked if possible. update, if given, modifies
+    each updated notebook in parallel. key identifies how the notebooks are
+    modified, all notebooks are updated if it changes. The sync is only
+    recorded after update succeeds, so the notebooks are updated again in the
+    next sync if it fails.
+    """
+    try:
+        updated, manifest = _sync_dir(src_dir, tgt_dir, key)
+    except OSError as e:
+        # e.g. a file in tgt_dir is now a directory in src_dir
+        logging.warning(f'Failed to sync {tgt_dir} incrementally: {e}')
+        shutil.rmtree(tgt_dir, ignore_errors=True)
+        updated, manifest = _sync_dir(src_dir, tgt_dir, key)
+    if update:
+        parallel_map(update, updated)
+    write_if_changed(os.path.join(tgt_dir, _SYNC_MANIFEST),
+                     json.dumps(manifest))
+    return updated
+
+def _sync_dir(src_dir, tgt_dir, key):
+    manifest_fname = os.path.join(tgt_dir, _SYNC_MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_fname):
+        with open(manifest_fname) as f:
+            manifest = json.load(f)
+    elif os.path.exists(tgt_dir):
+        # not synced before
+        shutil.rmtree(tgt_dir)
+    old_files = manifest.get('files', {})
+    same_key = manifest.get('key') == key
+    files, updated = {}, []
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+        dirnames[:] = [d for d in dirnames if d not in links]
+        for fn in filenames + links:
+            src = os.path.join(dirpath, fn)
+            rel = os.path.relpath(src, src_dir)
+            if rel == _SYNC_MANIFEST:
+                continue
+            tgt = os.path.join(tgt_dir, rel)
+            st = os.lstat(src)
+            is_link = os.path.islink(src)
+            is_notebook = fn.endswith('.ipynb') and not is_link
+            sig = ['link', os.readlink(src)] if is_link else [
+                st.st_size, st.st_mtime_ns]
+            files[rel] = sig
+            if (old_files.get(rel) == sig and os.path.lexists(tgt) and
+                    (same_key or not is_notebook)):
+                continue
+            if os.path.isdir(tgt) and not os.path.islink(tgt):
+                shutil.rmtree(tgt)
+            elif os.path.lexists(tgt):
+                os.remove(tgt)
+            mkdir(os.path.dirname(tgt))
+            if is_link:
+                os.symlink(sig[1], tgt)
+            elif is_notebook:
+                shutil.copy(src, tgt)
+                updated.append(tgt)
+            else:
+                try:
+                    os.link(src, tgt)
+                except OSError:
+                    shutil.copy2(src, tgt)
+    for dirpath, dirnames, filenames in os.walk(tgt_dir, topdown=False):
+        for fn in filenames + [d for d in dirnames if os.path.islink(
+                os.path.join(dirpath, d))]:
+            tgt = os.path.join(dirpath, fn)
+            rel = os.path.relpath(tgt, tgt_dir)
+            if rel not in files and rel != _SYNC_MANIFEST:
+                os.remove(tgt)
+        if dirpath != tgt_dir and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    mkdir(tgt_dir)
+    # the updated notebooks are not recorded until they are modified
+    copied = set([os.path.relpath(tgt, tgt_dir) for tgt in updated])
+    write_if_changed(manifest_fname, json.dumps({
+        'key': key, 'files': {
+            rel: sig for rel, sig in files.items() if rel not in copied}}))
+    return updated, {'key': key, 'files': files}
 
 def get_time_diff(tik, tok):
-    h, remainder = divmod((tok - tik).seconds, 3600)
+    return format_seconds((tok - tik).seconds)
+
+def format_seconds(seconds):
+    h, remainder = divmod(int(seconds), 3600)
     m, s = divmod(remainder, 60)
     return "%02d:%02d:%02d" % (h, m, s)
 
@@ -163,3 +293,49 @@ def split_config_str(config_str, num_items_per_line=None):
                           " match the required (%d)"%(i, len(items[-1]), num_items_per_line))
             logging.fatal("The raw string is:\n"+config_str)
     return items
+
+class _LogBuffer(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # make it picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+def _run_with_log_buffer(func, item):
+    root = logging.getLogger()
+    handlers = root.handlers
+    buffer = _LogBuffer()
+    root.handlers = [buffer]
+    try:
+        return func(item), buffer.records
+    finally:
+        root.handlers = handlers
+
+def parallel_map(func, items, num_workers=None):
+    """Return [func(item) for item in items] with a process pool.
+
+    The log messages in workers are emitted in the order of items, so the
+    outputs are the same as a sequential run.
+    """
+    items = list(items)
+    num_workers = min(num_workers or os.cpu_count() or 1, len(items))
+    if num_workers <= 1:
+        return [func(item) for item in items]
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        futures = [executor.submit(_run_with_log_buffer, func, item)
+                   for item in items]
+        for future in futures:
+            result, records = future.result()
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            results.append(result)
+    return results
@@ -0,0 +1,54 @@
+from d2lbook import utils
+import unittest
+import logging
+import os
+import tempfile
+import time
+
+def _square(x):
+    time.sleep(0.1 * (3 - x))
+    logging.info(f'square {x}')
+    return x * x
+
+def _fail(fname):
+    raise ValueError(fname)
+
+class TestUtils(unittest.TestCase):
+    def test_parallel_map(self):
+        with self.assertLogs() as logs:
+            results = utils.parallel_map(_square, range(4), num_workers=4)
+        self.assertEqual(results, [0, 1, 4, 9])
+        self.assertEqual(logs.output, [
+            f'INFO:root:square {x}' for x in range(4)])
+
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'a', 'b.txt')
+            self.assertTrue(utils.write_if_changed(fname, 'abc'))
+            self.assertFalse(utils.write_if_changed(fname, 'abc'))
+            self.assertTrue(utils.write_if_changed(fname, b'abcd'))
+            with open(fname) as f:
+                self.assertEqual(f.read(), 'abcd')
+            self.assertEqual(os.listdir(os.path.dirname(fname)), ['b.txt'])
+
+    def test_sync_dir(self):
+        with tempfile.TemporaryDirectory() as root:
+            src, tgt = os.path.join(root, 'src'), os.path.join(root, 'tgt')
+            for fn in ['a.ipynb', 'img/b.png', 'c.txt']:
+                utils.write_if_changed(os.path.join(src, fn), fn)
+            os.symlink('img', os.path.join(src, 'link'))
+            self.assertEqual(utils.sync_dir(src, tgt),
+                             [os.path.join(tgt, 'a.ipynb')])
+            self.assertTrue(os.path.samefile(os.path.join(src, 'img/b.png'),
+                                             os.path.join(tgt, 'img/b.png')))
+            self.assertEqual(os.readlink(os.path.join(tgt, 'link')), 'img')
+            self.assertEqual(utils.sync_dir(src, tgt), [])
+            os.remove(os.path.join(src, 'c.txt'))
+            self.assertEqual(utils.sync_dir(src, tgt, 'new key'),
+                             [os.path.join(tgt, 'a.ipynb')])
+            self.assertFalse(os.path.exists(os.path.join(tgt, 'c.txt')))
+            # not recorded if failed to update the notebooks
+            with self.assertRaises(ValueError):
+                utils.sync_dir(src, tgt, 'newer key', _fail)
+            self.assertEqual(utils.sync_dir(src, tgt, 'newer key'),
+                             [os.path.join(tgt, 'a.ipynb')])
@@ -11,6 +11,7 @@ requirements = [
     'sphinxcontrib-bibtex==2.4.2', # >=2.2 to enable citet and citep
     'pybtex-apa-style',
     'd2l-notedown',
+    'nbclient',
     'mxtheme>=0.3.17',
     'sphinxcontrib-svg2pdfconverter',
     'numpydoc',